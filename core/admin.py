@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from core.filters import OrderHasLabelFilter
+from core.filters import OrderHasLabelFilter, OrderRunningFilter
+from core.managers import claim_owner
 from core.tasks import *
 
 
@@ -61,7 +62,7 @@ class OrderAdmin(admin.ModelAdmin):
         'updated_at'
     )
 
-    list_filter = ('configuration', 'status', 'created_at', 'sequence', OrderHasLabelFilter, 'running')
+    list_filter = ('configuration', 'status', 'stage', 'created_at', 'sequence', OrderHasLabelFilter, OrderRunningFilter)
     actions = (
         'handle_get_expedition_info',
         'handle_get_update_orders',
@@ -101,29 +102,38 @@ class OrderAdmin(admin.ModelAdmin):
     contains_integrator_id.boolean = True
     contains_integrator_id.short_description = 'Integrator Id'
 
-    def handle_get_expedition_info(self, request, queryset):
-        for order in queryset:
-            print(order.id)
-            task_search_expedition.delay(
-                order.id
+    def dispatch_stage(self, request, queryset, task):
+        """
+        Reserva os pedidos para a task, como fazem os dispatchers; os que
+        estão com lease ativo seguem com quem os reservou.
+        """
+        owner = claim_owner()
+        ids = Order.objects.claim(queryset, owner=owner)
+
+        for order_id in ids:
+            task.delay(order_id, owner)
+
+        skipped = queryset.count() - len(ids)
+
+        if skipped:
+            self.message_user(
+                request,
+                f'{skipped} pedido(s) em processamento foram ignorados',
+                messages.WARNING
             )
 
+    def handle_get_expedition_info(self, request, queryset):
+        self.dispatch_stage(request, queryset, task_search_expedition)
+
     handle_get_expedition_info.short_description = 'Buscar expedição'
 
     def handle_get_update_orders(self, request, queryset):
-        for order in queryset:
-            print(order.id)
-            task_update_order.delay(
-                order.id
-            )
+        self.dispatch_stage(request, queryset, task_update_order)
 
     handle_get_update_orders.short_description = 'Atualizar pedidos'
 
     def handle_send_order_to_integrator(self, request, queryset):
-        for order in queryset:
-            task_send_order_to_integrador.delay(
-                order.id
-            )
+        self.dispatch_stage(request, queryset, task_send_order_to_integrador)
 
     handle_send_order_to_integrator.short_description = 'Enviar pedido'
 
@@ -144,18 +154,12 @@ class OrderAdmin(admin.ModelAdmin):
     handle_get_order_in_integrator.short_description = 'Buscar pedido - Integrador'
 
     def handle_send_label_to_integrator(self, request, queryset):
-        for order in queryset:
-            SendRequestLabelToIntegrator(
-                order
-            ).execute()
+        self.dispatch_stage(request, queryset, task_send_label_to_integrador)
 
     handle_send_label_to_integrator.short_description = 'Enviar etiqueta'
 
     def handle_send_billing_to_integrator(self, request, queryset):
-        for order in queryset:
-            SendRequestBillingToIntegrator(
-                order
-            ).execute()
+        self.dispatch_stage(request, queryset, task_send_billing_to_integrador)
 
     handle_send_billing_to_integrator.short_description = 'Enviar faturamento'
 
@@ -163,3 +167,8 @@ class OrderAdmin(admin.ModelAdmin):
 @admin.register(OrderItems)
 class OrderItemAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(OrderLabel)
+class OrderLabelAdmin(admin.ModelAdmin):
+    pass
@@ -34,3 +34,24 @@ class OrderHasLabelFilter(SimpleListFilter):
             ).exclude(processed=True)
 
         return queryset
+
+
+class OrderRunningFilter(SimpleListFilter):
+    title = 'Em processamento ?'
+    parameter_name = 'running'
+
+    def lookups(self, request, model_admin):
+        return (
+            (1, 'Sim'),
+            (-1, 'Não'),
+        )
+
+    def queryset(self, request, queryset):
+        value = self.value()
+
+        if value and int(value) > 0:
+            return queryset.exclude(Order.objects.available())
+        if value and int(value) < 0:
+            return queryset.filter(Order.objects.available())
+
+        return queryset
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis
+from requests import Response
+
+from core import logger
+from integration_tiny.settings import TINY_CACHE_SIZE
+
+INVALIDATION_CHANNEL = 'tiny:cache:invalidate'
+
+
+class LocalCache:
+    """
+    LRU em memória do processo, com expiração por entrada.
+    """
+
+    def __init__(self, maxsize=TINY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if not entry:
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self.__entries[key]
+                return None
+
+            self.__entries.move_to_end(key)
+
+            return value
+
+    def set(self, key, value, ttl):
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + ttl, value)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self.__lock:
+            for key in keys:
+                self.__entries.pop(key, None)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+class ResponseCache:
+    """
+    Cache de respostas GET do Tiny em dois níveis: LRU local e Redis
+    compartilhado entre os workers. O token nunca faz parte da chave.
+
+    As invalidações são publicadas em INVALIDATION_CHANNEL para que todos
+    os processos removam a entrada do LRU local. O LRU só é usado enquanto
+    o processo está inscrito no canal; ao reconectar ele é esvaziado, já
+    que invalidações podem ter sido perdidas.
+    """
+    RECONNECT_DELAY = 1
+
+    def __init__(self, connection: redis.Redis, local: LocalCache = None):
+        self.connection = connection
+        self.local = local or LocalCache()
+        self.__subscribed = threading.Event()
+        self.__generation = 0
+        self.__listener = None
+        self.__listener_lock = threading.Lock()
+
+    def listen(self):
+        with self.__listener_lock:
+            if self.__listener is None:
+                self.__listener = threading.Thread(
+                    target=self.__listen,
+                    name='response-cache-invalidation',
+                    daemon=True
+                )
+                self.__listener.start()
+
+    def __listen(self):
+        while True:
+            try:
+                with self.connection.pubsub(
+                    ignore_subscribe_messages=True
+                ) as pubsub:
+                    pubsub.subscribe(INVALIDATION_CHANNEL)
+
+                    self.invalidate()
+                    self.__subscribed.set()
+
+                    while True:
+                        message = pubsub.get_message(timeout=1.0)
+
+                        if message:
+                            self.invalidate(json.loads(message['data']))
+            except (redis.RedisError, ValueError) as error:
+                logger.warning(f'Response cache invalidation lost: {error}')
+
+            self.__subscribed.clear()
+            self.invalidate()
+
+            time.sleep(self.RECONNECT_DELAY)
+
+    def invalidate(self, keys=None):
+        # Leituras do Redis iniciadas antes da invalidação não podem mais
+        # ser guardadas no LRU local.
+        self.__generation += 1
+
+        if keys is None:
+            self.local.clear()
+        else:
+            self.local.delete(*keys)
+
+    @property
+    def use_local(self):
+        return self.__subscribed.is_set()
+
+    @staticmethod
+    def key(configuration_id, resource, params):
+        params = {
+            name: value
+            for name, value in params.items()
+            if name != 'token'
+        }
+        digest = hashlib.sha1(
+            json.dumps(params, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
+        return f'tiny:cache:{configuration_id}:{resource}:{digest}'
+
+    @staticmethod
+    def dumps(response: Response) -> bytes:
+        content_type = response.headers.get('Content-Type', '')
+
+        return content_type.encode() + b'\n' + response.content
+
+    @staticmethod
+    def loads(value: bytes) -> Response:
+        content_type, content = value.split(b'\n', 1)
+
+        response = Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = content_type.decode()
+        response._content = content
+        response.from_cache = True
+
+        return response
+
+    def get(self, key) -> Optional[Response]:
+        use_local = self.use_local
+        generation = self.__generation
+        value = self.local.get(key) if use_local else None
+
+        if value is None:
+            try:
+                with self.connection.pipeline() as pipe:
+                    value, ttl = pipe.get(key).ttl(key).execute()
+            except redis.RedisError as error:
+                logger.warning(f'Response cache unavailable: {error}')
+                return None
+
+            if value is None:
+                return None
+
+            if ttl > 0 and use_local and generation == self.__generation:
+                self.local.set(key, value, ttl)
+
+        return self.loads(value)
+
+    def set(self, key, response: Response, ttl):
+        value = self.dumps(response)
+
+        if self.use_local:
+            self.local.set(key, value, ttl)
+
+        try:
+            self.connection.set(key, value, ex=ttl)
+        except redis.RedisError as error:
+            logger.warning(f'Response cache unavailable: {error}')
+
+    def delete(self, *keys):
+        if not keys:
+            return
+
+        self.local.delete(*keys)
+
+        try:
+            self.connection.delete(*keys)
+            self.connection.publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        except redis.RedisError as error:
+            logger.warning(f'Response cache unavailable: {error}')
@@ -0,0 +1,228 @@
+import threading
+from typing import Dict
+from urllib.parse import urljoin, urlparse
+
+import redis
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.integration.cache import ResponseCache
+from core.integration.deadline import current_deadline
+from core.integration.exceptions import TransientError
+from core.integration.limiter import RateLimiter
+from core.integration.resilience import (CircuitBreaker, RetryPolicy,
+                                         get_breaker)
+from core.models import Configuration
+from integration_tiny.settings import (BASE_URL_INTEGRATOR, BASE_URL_TINY,
+                                       HTTP_CONNECT_TIMEOUT,
+                                       HTTP_POOL_CONNECTIONS,
+                                       HTTP_POOL_MAXSIZE, HTTP_READ_TIMEOUT,
+                                       RATE_LIMIT_REDIS_URL)
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_redis = None
+_response_cache = None
+_globals_lock = threading.Lock()
+
+
+def get_session(url) -> requests.Session:
+    """
+    Retorna a sessão do processo para o host da url, mantendo um pool de
+    conexões keep-alive por host em vez de abrir uma conexão por chamada.
+    """
+    parsed = urlparse(url)
+    host = f'{parsed.scheme}://{parsed.netloc}'
+
+    session = _sessions.get(host)
+    if session:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session:
+            return session
+
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_MAXSIZE
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        _sessions[host] = session
+
+    return session
+
+
+def get_redis() -> redis.Redis:
+    global _redis
+
+    if _redis is not None:
+        return _redis
+
+    with _globals_lock:
+        if _redis is None:
+            _redis = redis.Redis.from_url(
+                RATE_LIMIT_REDIS_URL,
+                socket_timeout=5,
+                socket_connect_timeout=5
+            )
+
+    return _redis
+
+
+def get_response_cache() -> ResponseCache:
+    global _response_cache
+
+    if _response_cache is not None:
+        return _response_cache
+
+    connection = get_redis()
+
+    with _globals_lock:
+        if _response_cache is None:
+            response_cache = ResponseCache(connection)
+            response_cache.listen()
+
+            _response_cache = response_cache
+
+    return _response_cache
+
+
+def get_timeout():
+    """
+    Timeouts de conexão e leitura, limitados pelo prazo restante da cadeia
+    de operações em andamento.
+    """
+    read_timeout = HTTP_READ_TIMEOUT
+    deadline = current_deadline()
+
+    if deadline:
+        read_timeout = max(min(read_timeout, deadline.remaining()), 1)
+
+    return HTTP_CONNECT_TIMEOUT, read_timeout
+
+
+def close_sessions():
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+
+        _sessions.clear()
+
+
+class Client:
+    BASE_URL: str = ''
+    UPSTREAM: str = ''
+
+    def __init__(self, configuration: Configuration):
+        self.configuration = configuration
+        self.retry_policy = RetryPolicy()
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return get_breaker(self.UPSTREAM, get_redis())
+
+    @property
+    def session(self) -> requests.Session:
+        return get_session(self.BASE_URL)
+
+    def get_headers(self) -> dict:
+        return {}
+
+    def get_params(self) -> dict:
+        return {}
+
+    def url(self, resource) -> str:
+        return urljoin(self.BASE_URL, resource)
+
+    def before_request(self):
+        pass
+
+    def request(self, method, resource, headers=None, params=None, **kwargs):
+        attempts = self.retry_policy.attempts_for(method)
+        deadline = current_deadline()
+        timeout = kwargs.pop('timeout', None)
+
+        for attempt in range(attempts):
+            self.breaker.before_call()
+            self.before_request()
+
+            is_last_attempt = attempt + 1 >= attempts or bool(
+                deadline and deadline.expired
+            )
+
+            try:
+                response = self.session.request(
+                    method,
+                    self.url(resource),
+                    headers={**self.get_headers(), **(headers or {})},
+                    params={**self.get_params(), **(params or {})},
+                    timeout=timeout or get_timeout(),
+                    **kwargs
+                )
+            except requests.RequestException as error:
+                self.breaker.record_failure()
+
+                if is_last_attempt:
+                    raise TransientError(
+                        f'Connection error by {self.UPSTREAM}: {error}'
+                    ) from error
+
+                self.retry_policy.sleep(attempt)
+                continue
+
+            if response.status_code in self.retry_policy.RETRY_STATUS_CODES:
+                self.breaker.record_failure()
+                response.close()
+
+                # Como nos erros de conexão, quem chama não precisa
+                # conferir o status para saber que o upstream falhou.
+                if is_last_attempt:
+                    raise TransientError(
+                        f'{self.UPSTREAM} responded with '
+                        f'{response.status_code}'
+                    )
+
+                self.retry_policy.sleep(attempt)
+                continue
+            else:
+                self.breaker.record_success()
+
+            return response
+
+    def get(self, resource, **kwargs):
+        return self.request('GET', resource, **kwargs)
+
+    def post(self, resource, **kwargs):
+        return self.request('POST', resource, **kwargs)
+
+
+class TinyClient(Client):
+    BASE_URL = BASE_URL_TINY
+    UPSTREAM = 'tiny'
+
+    def __init__(self, configuration: Configuration):
+        super().__init__(configuration)
+
+        self.limiter = RateLimiter(configuration, get_redis())
+
+    def before_request(self):
+        self.limiter.acquire()
+
+    def get_params(self):
+        return dict(
+            token=self.configuration.token
+        )
+
+
+class IntegratorClient(Client):
+    BASE_URL = BASE_URL_INTEGRATOR
+    UPSTREAM = 'integrator'
+
+    def get_headers(self):
+        return {
+            'Authorization': f'Token {self.configuration.token_integrator}',
+        }
@@ -0,0 +1,52 @@
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from core.integration.exceptions import DeadlineExceeded
+from integration_tiny.settings import TASK_DEADLINE
+
+_current_deadline: ContextVar[Optional['Deadline']] = ContextVar(
+    'deadline', default=None
+)
+
+
+class Deadline:
+    """
+    Orçamento de tempo de uma cadeia de operações. Fica disponível para
+    todas as operações executadas dentro do bloco `with`.
+    """
+
+    def __init__(self, seconds=TASK_DEADLINE):
+        self.expires_at = time.monotonic() + seconds
+        self.__token = None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, step):
+        if self.expired:
+            raise DeadlineExceeded(step)
+
+    def __enter__(self):
+        self.__token = _current_deadline.set(self)
+
+        return self
+
+    def __exit__(self, *args):
+        _current_deadline.reset(self.__token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def check_deadline(step):
+    deadline = current_deadline()
+
+    if deadline:
+        deadline.check(step)
+
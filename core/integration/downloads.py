@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from tempfile import TemporaryFile
+from typing import BinaryIO, List
+
+import requests
+
+from core.integration.client import get_session, get_timeout
+from core.integration.exceptions import (OperationError, TransientError,
+                                         classify_status_code)
+from integration_tiny.settings import (LABEL_DOWNLOAD_CONCURRENCY,
+                                       LABEL_MAX_SIZE, STREAM_CHUNK_SIZE)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Executor do processo para downloads, compartilhado entre os pedidos
+    processados ao mesmo tempo pelo worker.
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=LABEL_DOWNLOAD_CONCURRENCY,
+                    thread_name_prefix='downloads'
+                )
+
+    return _executor
+
+
+def download(url, max_size=LABEL_MAX_SIZE) -> BinaryIO:
+    """
+    Baixa a url para um arquivo temporário, usando o pool de conexões do
+    host, sem manter o conteúdo em memória. O arquivo volta posicionado
+    no início e deve ser fechado por quem chamou.
+    """
+    file = TemporaryFile()
+
+    try:
+        with get_session(url).get(
+            url,
+            stream=True,
+            timeout=get_timeout()
+        ) as response:
+            if response.status_code != 200:
+                raise classify_status_code(response.status_code)(
+                    f'Download of {url} failed with {response.status_code}'
+                )
+
+            length = int(response.headers.get('content-length') or 0)
+            if length > max_size:
+                raise OperationError(
+                    f'Download of {url} has {length} bytes, '
+                    f'limit is {max_size}'
+                )
+
+            size = 0
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+
+                if size > max_size:
+                    raise OperationError(
+                        f'Download of {url} exceeds {max_size} bytes'
+                    )
+
+                file.write(chunk)
+
+    except requests.RequestException as error:
+        file.close()
+        raise TransientError(f'Download of {url} failed: {error}') from error
+    except BaseException:
+        file.close()
+        raise
+
+    file.seek(0)
+
+    return file
+
+
+def download_all(urls, max_size=LABEL_MAX_SIZE) -> List[BinaryIO]:
+    """
+    Baixa as urls ao mesmo tempo e devolve os arquivos na mesma ordem. Se
+    algum download falhar os demais arquivos são fechados.
+    """
+    executor = get_executor()
+    futures = [
+        executor.submit(copy_context().run, download, url, max_size)
+        for url in urls
+    ]
+
+    files = []
+    error = None
+
+    for future in futures:
+        try:
+            files.append(future.result())
+        except Exception as exception:
+            error = error or exception
+
+    if error:
+        for file in files:
+            file.close()
+
+        raise error
+
+    return files
@@ -0,0 +1,88 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable
+
+from django.db import connections
+
+from core import logger
+from core.integration.exceptions import OperationError
+from core.integration.pipeline import (RETRYABLE_ERRORS, fail_stage,
+                                       retry_stage, run_stage)
+from core.models import LeaseLost, Order
+from integration_tiny.settings import UPDATE_ORDERS_CONCURRENCY
+
+
+class OrdersEngine:
+    """
+    Executa a etapa de cada pedido de um lote com até `limit` pedidos
+    em andamento ao mesmo tempo.
+
+    As operações usam clientes HTTP e o ORM de forma bloqueante, então
+    cada pedido roda em uma thread do executor, que limita quantos estão
+    em voo.
+    """
+    STAGE: str = None
+
+    def __init__(self, order_ids: Iterable[int], limit=None, owner=None):
+        self.order_ids = list(order_ids)
+        self.limit = limit or UPDATE_ORDERS_CONCURRENCY
+        self.owner = owner
+
+    def process(self, order_id):
+        try:
+            order = Order.objects.select_related(
+                'configuration'
+            ).get(id=order_id)
+        except Order.DoesNotExist:
+            return
+
+        try:
+            run_stage(order, self.STAGE, self.owner)
+        except LeaseLost as error:
+            logger.info(f'[Order {order}] - Stage {self.STAGE}: {error}')
+        except RETRYABLE_ERRORS as error:
+            retry_stage(order, self.STAGE, error)
+        except OperationError as error:
+            fail_stage(order, self.STAGE, error)
+        except Exception as error:
+            # Erro inesperado: o pedido volta para os dispatchers em vez de
+            # ficar reservado até o lease expirar.
+            logger.exception(
+                f'[Order {order}] - Stage {self.STAGE}: {error}'
+            )
+            fail_stage(order, self.STAGE, error)
+        finally:
+            connections.close_all()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.limit) as executor:
+            futures = {
+                executor.submit(self.process, order_id): order_id
+                for order_id in self.order_ids
+            }
+
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    logger.exception(
+                        f'[Order {futures[future]}] - Stage {self.STAGE}: '
+                        f'{error}'
+                    )
+
+    def execute(self):
+        if not self.order_ids:
+            return
+
+        logger.info(
+            f'Stage {self.STAGE} of {len(self.order_ids)} orders '
+            f'with {self.limit} in flight'
+        )
+        self.run()
+
+
+class UpdateOrdersEngine(OrdersEngine):
+    STAGE = Order.STAGE_ORDER
+
+
+class SearchExpeditionsEngine(OrdersEngine):
+    STAGE = Order.STAGE_EXPEDITION
@@ -1,26 +1,67 @@
-from json.decoder import JSONDecodeError
+import hashlib
+import json
+from functools import cached_property
+from operator import attrgetter
+from typing import Callable, Tuple
+from xml.parsers.expat import ExpatError
 
-from utils.formatts import Formatattr
+import xmltodict
 
+from utils import normalize
 
-class Base:
 
-    def to_dict(self):
-        attribs = [(k, v) for k, v in self.__dict__.items() if not k.startswith("_")]
+def fingerprint(*payloads):
+    """
+    Hash estável dos dados normalizados de um pedido ou nota fiscal, usado
+    para detectar se o Tiny retornou algo diferente da última consulta.
+    """
+    content = json.dumps(
+        payloads,
+        sort_keys=True,
+        default=lambda value: value.to_dict()
+    )
+
+    return hashlib.sha256(content.encode()).hexdigest()
+
 
-        for name in dir(self.__class__):
-            if name.startswith("_"):
-                continue
-            obj = getattr(self.__class__, name)
+class Base:
+    """
+    Os campos de cada entidade são levantados uma vez, na criação da
+    classe: os atributos públicos de `__slots__`, na ordem declarada,
+    seguidos das properties em ordem alfabética.
+    """
+    __slots__ = ()
+
+    _fields: Tuple[Tuple[str, Callable], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        attributes = [
+            (name, attrgetter(name))
+            for klass in reversed(cls.__mro__)
+            for name in klass.__dict__.get('__slots__', ())
+            if not name.startswith('_')
+        ]
+        properties = [
+            (name, value.fget)
+            for name, value in sorted(
+                (name, getattr(cls, name)) for name in dir(cls)
+            )
+            if not name.startswith('_') and isinstance(value, property)
+        ]
 
-            if isinstance(obj, property):
-                val = obj.__get__(self, self.__class__)
-                attribs.append((name, val))
+        cls._fields = tuple(attributes + properties)
 
-        return dict(attribs)
+    def to_dict(self):
+        return {name: getter(self) for name, getter in self._fields}
 
 
 class CustomerData(Base):
+    __slots__ = (
+        '__name', '__cnpj_cpf', '__postal_code', '__address', '__complement',
+        '__neighbourhood', '__state', '__city', '__number'
+    )
 
     def __init__(self, data):
         self.__name = data.get('nome', None)
@@ -64,30 +105,61 @@ class CustomerData(Base):
 
     @property
     def cnpj_cpf(self):
-        return Formatattr(self.__cnpj_cpf).in_cnpj.value
+        return normalize.cnpj(self.__cnpj_cpf)
 
     @property
     def postal_code(self):
-        return Formatattr(
-            self.__postal_code
-        ).remove_character.in_zip_code.value
+        return normalize.postal_code(self.__postal_code)
 
 
 class OrderItemData(Base):
+    __slots__ = (
+        'product', 'description', 'unit_of_measurement', '__quantity',
+        '__unity_price'
+    )
+
     def __init__(self, data: dict):
+        self.__load(
+            data,
+            normalize.decimal(data.get('quantidade', 0)),
+            normalize.decimal(data.get('valor_unitario', 0))
+        )
+
+    def __load(self, data: dict, quantity, unit_price):
         self.product = data.get('codigo', None)
         self.description = data.get('descricao', None)
         self.unit_of_measurement = data.get('unidade', None)
-        self.__quantity = data.get('quantidade', 0)
-        self.__unity_price = data.get('valor_unitario', 0)
+        self.__quantity = quantity
+        self.__unity_price = unit_price
+
+    @classmethod
+    def many(cls, items: list) -> list:
+        # Normaliza as colunas de uma vez em vez de item a item.
+        items = [item.get('item', {}) for item in items]
+
+        quantities = normalize.decimals(
+            item.get('quantidade', 0) for item in items
+        )
+        prices = normalize.decimals(
+            item.get('valor_unitario', 0) for item in items
+        )
+
+        instances = []
+
+        for item, quantity, price in zip(items, quantities, prices):
+            instance = cls.__new__(cls)
+            instance.__load(item, quantity, price)
+            instances.append(instance)
+
+        return instances
 
     @property
     def quantity(self):
-        return Formatattr(self.__quantity).format_float.value
+        return self.__quantity
 
     @property
     def unit_price(self):
-        return Formatattr(self.__unity_price).format_float.value
+        return self.__unity_price
 
     @property
     def total_price(self):
@@ -95,6 +167,8 @@ class OrderItemData(Base):
 
 
 class OrderResumeData(Base):
+    __slots__ = ('identifier', '__number', '__number_store')
+
     def __init__(self, data: dict):
         self.identifier = data.get('id', None)
         self.__number = data.get('numero', None)
@@ -113,6 +187,10 @@ class OrderResumeData(Base):
 
 
 class OrderData(Base):
+    __slots__ = (
+        'invoice_id', '__number', '__number_store', '__observation',
+        '__customer', '__items'
+    )
 
     def __init__(self, data: dict):
         self.__number = data.get('numero', None)
@@ -142,23 +220,19 @@ class OrderData(Base):
 
     @property
     def items(self):
-        items = []
-
-        for item in self.__items:
-            informations_item = item.get('item', {})
-
-            items.append(OrderItemData(informations_item))
-
-        return items
+        return OrderItemData.many(self.__items)
 
     @property
     def observation(self):
-        return Formatattr(
-            self.__observation
-        ).remove_character.remove_blank.value
+        return normalize.text(self.__observation)
 
 
 class InvoiceData(Base):
+    __slots__ = (
+        'sequence', 'access_key', 'invoice', '__invoice_status',
+        '__transport', '__items'
+    )
+
     def __init__(self, data: dict):
         self.sequence = data.get('serie', None)
         self.access_key = data.get('chave_acesso', None)
@@ -177,129 +251,138 @@ class InvoiceData(Base):
         cnpj = self.__transport.get('cpf_cnpj', None)
 
         if cnpj:
-            return Formatattr(
-                cnpj
-            ).in_cnpj.value
+            return normalize.cnpj(cnpj)
 
         return cnpj
 
     @property
     def items(self):
-        items = []
-
-        for item in self.__items:
-            informations_item = item.get('item', {})
-
-            items.append(OrderItemData(informations_item))
-
-        return items
+        return OrderItemData.many(self.__items)
 
 
 class OrderExpeditionInfo(Base):
+    __slots__ = ('expedition_id', 'group_expedition_id')
+
     def __init__(self, data: dict):
         self.expedition_id = data.get('id', None)
         self.group_expedition_id = data.get('idAgrupamento', None)
 
 
 class ResponseSerializer:
+    """
+    Decodifica a resposta do Tiny só no primeiro acesso, escolhendo o
+    formato pelo content type (ou pelo início do conteúdo), e guarda cada
+    visão derivada. As visões são compartilhadas entre os acessos, então
+    quem precisar alterá-las deve trabalhar em uma cópia.
+    """
+    JSON = 'json'
+    XML = 'xml'
+    RAW = 'raw'
+
     def __init__(self, response):
-        self.__errors = []
-        try:
-            self.data = response.json()
-            self.__root = self.data.get('retorno', {})
-            self.__orders = self.__root.get('pedidos', [])
-            self.__pages = self.__root.get('numero_paginas', 1)
-            self.__order = self.__root.get('pedido', {})
-            self.__invoice = self.__root.get('nota_fiscal', {})
-            self.__errors = self.__root.get('erros', None)
-            self.__expedition = self.__root.get('expedicao', {})
-            self.__labels = self.__root.get('links', [])
+        self.response = response
 
-        except JSONDecodeError:
-            self.data = response.content
+    @cached_property
+    def format(self):
+        content_type = self.response.headers.get('content-type', '').lower()
 
-    def __serializer_orders(self):
-        return [OrderResumeData(
-            order.get('pedido')
-        ).to_dict() for order in self.__orders]
+        if 'json' in content_type:
+            return self.JSON
 
-    def __serializer_order(self):
-        return OrderData(self.__order).to_dict()
+        if 'xml' in content_type:
+            return self.XML
 
-    def __serializer_invoice(self):
-        return InvoiceData(self.__invoice).to_dict()
+        start = self.response.content[:64].lstrip()[:1]
 
-    def __serializer_errors(self):
-        if self.__errors:
-            if isinstance(self.__errors, list):
-                return self.__errors[0].get('erro')
+        if start in (b'{', b'['):
+            return self.JSON
 
-            return self.__errors.get('erro')
+        if start == b'<':
+            return self.XML
 
-    def __serializer_expedition(self):
-        return OrderExpeditionInfo(self.__expedition).to_dict()
+        return self.RAW
 
-    def __serializer_labels(self):
-        if not self.__labels:
-            return []
+    @cached_property
+    def data(self):
+        try:
+            if self.format == self.JSON:
+                return self.response.json()
 
-        return [
-            label.get('link')
-            for label in self.__labels
-        ]
+            if self.format == self.XML:
+                return xmltodict.parse(self.response.content)
+        except (ValueError, ExpatError):
+            pass
 
-    @property
-    def invoice(self):
-        return self.__serializer_invoice()
+        return self.response.content
 
-    @property
+    @cached_property
+    def root(self) -> dict:
+        if not isinstance(self.data, dict):
+            return {}
+
+        return self.data.get('retorno') or {}
+
+    @cached_property
     def orders(self):
-        return self.__serializer_orders()
+        return [
+            OrderResumeData(order.get('pedido')).to_dict()
+            for order in self.root.get('pedidos') or []
+        ]
 
-    @property
+    @cached_property
     def order(self):
-        return self.__serializer_order()
+        return OrderData(self.root.get('pedido') or {}).to_dict()
 
-    @property
+    @cached_property
+    def invoice(self):
+        return InvoiceData(self.root.get('nota_fiscal') or {}).to_dict()
+
+    @cached_property
     def errors(self):
-        return self.__serializer_errors()
+        errors = self.root.get('erros')
 
-    @property
+        if errors:
+            if isinstance(errors, list):
+                return errors[0].get('erro')
+
+            return errors.get('erro')
+
+    @cached_property
     def labels(self):
-        return self.__serializer_labels()
+        return [
+            label.get('link')
+            for label in self.root.get('links') or []
+        ]
 
-    @property
+    @cached_property
     def expedition(self):
-        return self.__serializer_expedition()
+        return OrderExpeditionInfo(self.root.get('expedicao') or {}).to_dict()
 
     @property
     def has_error(self):
-        if self.__errors:
-            return bool(len(self.__errors))
-
-        return False
+        return bool(self.root.get('erros'))
 
     @property
     def status(self):
-        return self.__root.get(
+        return self.root.get(
             'status_processamento',
             None
         )
 
     @property
     def verbose_status(self):
-        return self.__root.get(
+        return self.root.get(
             'status',
             None
         )
 
     @property
     def code(self):
-        return self.__root.get(
+        return self.root.get(
             'codigo_erro',
             None
         )
 
-    @property
+    @cached_property
     def pages(self):
-        return self.__pages
+        return int(self.root.get('numero_paginas') or 1)
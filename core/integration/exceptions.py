@@ -0,0 +1,67 @@
+class OperationError(Exception):
+    pass
+
+
+class RateLimitError(OperationError):
+    pass
+
+
+class ThrottledError(OperationError):
+    pass
+
+
+class TransientError(OperationError):
+    pass
+
+
+class CircuitOpenError(OperationError):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    def __init__(self, step):
+        self.step = step
+
+        super().__init__(f'Deadline exceeded before {step}')
+
+
+# Códigos de erro da API do Tiny (codigo_erro)
+THROTTLED_ERROR_CODES = (
+    6,  # API bloqueada momentaneamente - muitos acessos no último minuto
+    11,  # API bloqueada momentaneamente - muitos acessos concorrentes
+)
+TRANSIENT_ERROR_CODES = (
+    35,  # Erro inesperado, tente novamente
+    99,  # Sistema em manutenção
+)
+
+
+def classify_error(code, message=None):
+    try:
+        code = int(code)
+    except (TypeError, ValueError):
+        code = None
+
+    if code in THROTTLED_ERROR_CODES:
+        return ThrottledError
+
+    if code in TRANSIENT_ERROR_CODES:
+        return TransientError
+
+    # Sem código, a mensagem é a única indicação de bloqueio. Com código,
+    # vale a classificação acima: bloqueios permanentes (API sem acesso,
+    # empresa bloqueada) não passam com o tempo.
+    if code is None and message and 'bloqueada' in str(message).lower():
+        return ThrottledError
+
+    return OperationError
+
+
+def classify_status_code(status_code):
+    if status_code == 429:
+        return ThrottledError
+
+    if status_code >= 500:
+        return TransientError
+
+    return OperationError
@@ -0,0 +1,159 @@
+import hashlib
+import time
+
+import redis
+
+from core import logger
+from core.integration.exceptions import RateLimitError
+from core.models import Configuration
+from integration_tiny.settings import (RATE_LIMIT_BLOCK_SECONDS,
+                                       RATE_LIMIT_MAX_WAIT)
+
+TOKEN_BUCKET_SCRIPT = """
+local key = KEYS[1]
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call(
+    'HMGET', key, 'tokens', 'timestamp', 'factor', 'blocked_until'
+)
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+local factor = tonumber(bucket[3]) or 1
+local blocked_until = tonumber(bucket[4]) or 0
+
+if now < blocked_until then
+    return tostring(blocked_until - now)
+end
+
+rate = rate * factor
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+
+redis.call('HSET', key, 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', key, math.ceil(capacity / rate) + 3600)
+
+return tostring(wait)
+"""
+
+FEEDBACK_SCRIPT = """
+local key = KEYS[1]
+local factor = tonumber(ARGV[1])
+local minimum = tonumber(ARGV[2])
+local blocked_until = tonumber(ARGV[3])
+
+local current = tonumber(redis.call('HGET', key, 'factor')) or 1
+
+if factor < 1 then
+    current = math.max(minimum, current * factor)
+    redis.call('HSET', key, 'tokens', 0, 'blocked_until', blocked_until)
+else
+    if current >= 1 then
+        return tostring(current)
+    end
+    current = math.min(1, current + factor - 1)
+end
+
+redis.call('HSET', key, 'factor', current)
+
+return tostring(current)
+"""
+
+
+class RateLimiter:
+    """
+    Token bucket compartilhado entre os workers via Redis, um por token do
+    Tiny, respeitando o limite por minuto cadastrado na configuração.
+
+    A vazão é adaptativa: cada bloqueio por excesso de acessos reduz o
+    fator pela metade e pausa o token, e cada sucesso o recupera aos poucos.
+    """
+    DECREASE_FACTOR = 0.5
+    INCREASE_STEP = 0.05
+    MIN_FACTOR = 0.1
+
+    def __init__(self, configuration: Configuration, connection: redis.Redis):
+        self.configuration = configuration
+        self.connection = connection
+        self.script = connection.register_script(TOKEN_BUCKET_SCRIPT)
+        self.feedback_script = connection.register_script(FEEDBACK_SCRIPT)
+
+    @property
+    def key(self):
+        token = hashlib.sha1(
+            self.configuration.token.encode()
+        ).hexdigest()
+
+        return f'tiny:ratelimit:{token}'
+
+    @property
+    def rate(self):
+        return max(self.configuration.rate_limit, 1) / 60
+
+    @property
+    def capacity(self):
+        return max(self.configuration.rate_limit_burst, 1)
+
+    def try_acquire(self) -> float:
+        wait = self.script(
+            keys=[self.key],
+            args=[self.rate, self.capacity, time.time()]
+        )
+
+        return float(wait)
+
+    def acquire(self, max_wait=RATE_LIMIT_MAX_WAIT):
+        waited = 0
+
+        while True:
+            try:
+                wait = self.try_acquire()
+            except redis.RedisError as error:
+                logger.warning(
+                    f'[{self.configuration}] - Rate limiter unavailable: {error}'
+                )
+                return
+
+            if not wait:
+                return
+
+            if waited + wait > max_wait:
+                raise RateLimitError(
+                    f'Rate limit of {self.configuration.rate_limit}/min '
+                    f'exceeded by {self.configuration}'
+                )
+
+            time.sleep(wait)
+            waited += wait
+
+    def feedback(self, factor, blocked_until=0):
+        try:
+            return float(self.feedback_script(
+                keys=[self.key],
+                args=[factor, self.MIN_FACTOR, blocked_until]
+            ))
+        except redis.RedisError as error:
+            logger.warning(
+                f'[{self.configuration}] - Rate limiter unavailable: {error}'
+            )
+
+    def succeeded(self):
+        self.feedback(1 + self.INCREASE_STEP)
+
+    def throttled(self):
+        factor = self.feedback(
+            self.DECREASE_FACTOR,
+            time.time() + RATE_LIMIT_BLOCK_SECONDS
+        )
+
+        logger.warning(
+            f'[{self.configuration}] - Tiny throttled the token, '
+            f'request rate reduced to {factor}'
+        )
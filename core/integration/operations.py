@@ -1,28 +1,54 @@
 import json
 import os
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, closing
+from contextvars import copy_context
+from functools import partial
+from io import BufferedReader
+from tempfile import TemporaryFile
 from typing import List
 from urllib.parse import urljoin, urlparse
-from urllib.request import urlopen
-from zipfile import BadZipfile, ZipFile
+from zipfile import ZipFile, is_zipfile
 
-import requests
-import xmltodict
-from django.core.files.base import ContentFile
+import redis
+from django.core.files.base import File
+from django.db.models import Q
+from django.dispatch import receiver
 from django.forms import model_to_dict
 from django.utils import timezone
-from requests import Response
+from requests import RequestException, Response
 
 from core import logger
-from core.integration.entities import OrderItemData, ResponseSerializer
-from core.models import Configuration, Customer, Order, OrderItems
-from integration_tiny.settings import (BASE_URL_INTEGRATOR, BASE_URL_TINY)
+from core.integration.cache import ResponseCache
+from core.integration.client import (IntegratorClient, TinyClient,
+                                     get_redis, get_response_cache,
+                                     get_session, get_timeout)
+from core.integration.deadline import check_deadline
+from core.integration.downloads import download_all
+from core.integration.entities import (OrderItemData, ResponseSerializer,
+                                       fingerprint)
+from core.integration.exceptions import (OperationError, ThrottledError,
+                                         TransientError, classify_error,
+                                         classify_status_code)
+from core.integration.streams import (ConcatenatedReader, HeadRecorder,
+                                      extract_element, rewind)
+from core.integration.uploads import MultipartBody
+from core.models import (Configuration, Customer, Order, OrderItems,
+                         OrderLabel, order_status_changed)
+from integration_tiny.settings import (BASE_URL_TINY,
+                                       INTEGRATOR_BATCH_RETRY_AFTER,
+                                       STREAM_CHUNK_SIZE,
+                                       SYNC_ORDERS_CONCURRENCY, TINY_CACHE_TTL)
+
+BATCH_UNSUPPORTED_KEY = 'integrator:batch:unsupported'
 
 
 def request(resource, params):
-    response = requests.get(
-        urljoin(BASE_URL_TINY, resource),
-        params=params
+    url = urljoin(BASE_URL_TINY, resource)
+    response = get_session(url).get(
+        url,
+        params=params,
+        timeout=get_timeout()
     )
 
     if response and response.status_code == 200:
@@ -31,45 +57,83 @@ def request(resource, params):
     raise ConnectionError('Connection error by Tiny')
 
 
-class OperationError(Exception):
-    pass
-
-
 class BaseOperation(object):
     RESOURCE: str = ''
 
     def __init__(self, configuration):
         self.configuration: Configuration = configuration
+        self.client = TinyClient(self.configuration)
         self.params = dict(
-            formato='json',
-            token=self.configuration.token
+            formato='json'
         )
         self.resource: str = self.RESOURCE
 
         self.update_params()
 
-    @staticmethod
-    def serializer(response) -> ResponseSerializer:
+    @property
+    def cache_ttl(self) -> int:
+        return TINY_CACHE_TTL.get(self.resource, 0)
+
+    @property
+    def cache_key(self) -> str:
+        return ResponseCache.key(
+            self.configuration.pk,
+            self.resource,
+            self.params
+        )
+
+    def serializer(self, response) -> ResponseSerializer:
         serializer = ResponseSerializer(response)
 
         if not serializer.has_error:
+            if not getattr(response, 'from_cache', False):
+                self.client.limiter.succeeded()
+
+                if self.cache_ttl:
+                    get_response_cache().set(
+                        self.cache_key,
+                        response,
+                        self.cache_ttl
+                    )
+
             return serializer
 
-        raise OperationError(serializer.errors)
+        error_class = classify_error(serializer.code, serializer.errors)
+
+        if issubclass(error_class, ThrottledError):
+            self.client.limiter.throttled()
+
+        raise error_class(serializer.errors)
 
     def update_params(self):
         pass
 
     def request(self) -> Response:
-        response = requests.get(
-            urljoin(BASE_URL_TINY, self.resource),
-            params=self.params
+        if self.cache_ttl:
+            response = get_response_cache().get(self.cache_key)
+
+            if response:
+                return response
+
+        return self.send(self.params)
+
+    def send(self, params, **kwargs) -> Response:
+        response = self.client.get(
+            self.resource,
+            params=params,
+            **kwargs
         )
 
         if response and response.status_code == 200:
             return response
 
-        raise OperationError('Connection error by Tiny')
+        response.close()
+        error_class = classify_status_code(response.status_code)
+
+        if issubclass(error_class, ThrottledError):
+            self.client.limiter.throttled()
+
+        raise error_class('Connection error by Tiny')
 
     def after_execution(self):
         pass
@@ -81,6 +145,8 @@ class BaseOperation(object):
         pass
 
     def execute(self):
+        check_deadline(self.__class__.__name__)
+
         response = self.request()
 
         serializer = self.serializer(response)
@@ -92,22 +158,28 @@ class BaseOperation(object):
         self.after_execution()
 
 
+def check_integrator_response(response: Response, resource):
+    if 200 <= response.status_code < 300:
+        return
+
+    response.close()
+    error_class = classify_status_code(response.status_code)
+
+    raise error_class(
+        f'Integrator responded {response.status_code} to {resource}'
+    )
+
+
 class GetOrderInIntegrator:
     def __init__(self, order: Order):
         self.__order = order
         self.__configuration = order.configuration
+        self.__client = IntegratorClient(self.__configuration)
 
     def send_request(self):
-        resource = urljoin(
-            BASE_URL_INTEGRATOR,
-            f'orders?order_number={self.__order.number}'
-        )
-        headers = {
-            'Authorization': f'Token {self.__configuration.token_integrator}',
-        }
-        response = requests.get(
-            url=resource,
-            headers=headers
+        response = self.__client.get(
+            'orders',
+            params={'order_number': self.__order.number}
         )
 
         if response and response.status_code == 200:
@@ -135,6 +207,7 @@ class SendRequestToIntegrator:
     def __init__(self, order: Order):
         self.__order = order
         self.__configuration = order.configuration
+        self.__client = IntegratorClient(self.__configuration)
 
     def __serializer_payload(self):
         payload = model_to_dict(
@@ -165,20 +238,17 @@ class SendRequestToIntegrator:
         return payload
 
     @property
-    def payload(self):
-        payload = self.__serializer_payload()
+    def data(self):
+        return self.__serializer_payload()
 
-        return json.dumps(payload)
+    @property
+    def payload(self):
+        return json.dumps(self.data)
 
     def send_request_by_integrator(self):
-        resource = urljoin(BASE_URL_INTEGRATOR, 'orders/simple')
-        headers = {
-            'content-type': 'application/json',
-            'Authorization': f'Token {self.__configuration.token_integrator}'
-        }
-        response = requests.post(
-            url=resource,
-            headers=headers,
+        response = self.__client.post(
+            'orders/simple',
+            headers={'content-type': 'application/json'},
             data=self.payload
         )
 
@@ -193,14 +263,8 @@ class SendRequestToIntegrator:
             ]
         )
 
-    def execute(self):
-        if self.__order.integrator_id:
-            self.update_status()
-
-        response = self.send_request_by_integrator()
-
-        content = response.json()
-        if response.status_code != 201:
+    def handle(self, status_code, content):
+        if status_code != 201:
             if 'order_number' in content:
                 GetOrderInIntegrator(
                     self.__order
@@ -215,38 +279,56 @@ class SendRequestToIntegrator:
 
         self.update_status()
 
-        SendRequestBillingToIntegrator(
-            self.__order
-        ).execute()
+    def execute(self):
+        check_deadline(self.__class__.__name__)
+
+        if self.__order.integrator_id:
+            self.update_status()
+
+        response = self.send_request_by_integrator()
+
+        self.handle(response.status_code, response.json())
 
 
 class SendRequestLabelToIntegrator:
     def __init__(self, order: Order):
         self.__order = order
         self.__configuration = order.configuration
+        self.__client = IntegratorClient(self.__configuration)
 
     @property
-    def payload(self):
-        return [
-            ('attachment', self.__order.label.open('rb'))
-        ]
+    def filename(self):
+        _, extension = os.path.splitext(self.__order.label.name)
 
-    def send_request(self):
-        resource = urljoin(
-            BASE_URL_INTEGRATOR,
-            f'orders/{self.__order.integrator_id}/attachment'
-        )
-        headers = {
-            'Authorization': f'Token {self.__configuration.token_integrator}',
-        }
-        response = requests.post(
-            url=resource,
-            headers=headers,
-            files=self.payload
-        )
+        return f'{self.__order.number}{extension}'
+
+    @property
+    def files(self):
+        yield self.filename, self.__order.label
+
+        for label in self.__order.extra_labels.all():
+            yield label.filename, label.file
+
+    def send_file(self, filename, file):
+        with MultipartBody([('attachment', filename, file)]) as payload:
+            response = self.__client.post(
+                f'orders/{self.__order.integrator_id}/attachment',
+                headers={'content-type': payload.content_type},
+                data=payload
+            )
+
+        check_integrator_response(response, 'attachment')
 
         return response.content
 
+    def send_request(self):
+        # Um anexo por requisição: a etiqueta e depois as partes extras. A
+        # primeira parte recusada interrompe o envio, que é refeito inteiro.
+        return [
+            self.send_file(filename, file)
+            for filename, file in self.files
+        ]
+
     def execute(self):
         if not self.__order.integrator_id:
             return
@@ -254,12 +336,15 @@ class SendRequestLabelToIntegrator:
         if not self.__order.label:
             return
 
+        check_deadline(self.__class__.__name__)
+
         self.send_request()
         self.__order.set_sent_label()
 
 
 class SaveLabelOrder(BaseOperation):
     RESOURCE = 'expedicao.obter.etiquetas.impressao.php'
+    ZPL_EXTENSIONS = ('.zpl', '.txt')
 
     def __init__(self, configuration, order):
         self.__order: Order = order
@@ -271,38 +356,102 @@ class SaveLabelOrder(BaseOperation):
             idExpedicao=self.__order.expedition_id
         )
 
-    def generate_file(self, content, filename):
+    def generate_file(self, content: File, filename):
         _, extension = os.path.splitext(filename)
 
         extension = (extension, '.zpl')[extension == '.txt']
-        self.__order.label.save(
+        self.__order.save_file(
+            'label',
             os.path.join(
                 self.__order.configuration.name,
                 f'{self.__order.number}{extension}'
             ),
-            ContentFile(content)
+            content
         )
 
-    def save_label(self, labels):
-        for label in labels:
-            path = urlparse(label).path
+    def save_extra_file(self, content: File, index, extension):
+        label = OrderLabel(order=self.__order, idseq=index)
+        label.file.save(
+            os.path.join(
+                self.__order.configuration.name,
+                f'{self.__order.number}-{index}{extension}'
+            ),
+            content
+        )
 
-            filename, extension = os.path.splitext(path)
-            if not extension:
+        logger.info(
+            f'Extra label of order {self.__order} saved in {label.file.name}'
+        )
+
+    def label_parts(self, links, files, stack: ExitStack):
+        """
+        Partes de etiqueta de todos os links, como (extensão, abertura).
+        Arquivos ZIP viram uma parte por membro, lida direto do arquivo
+        compactado quando for gravada.
+        """
+        for link, file in zip(links, files):
+            _, extension = os.path.splitext(urlparse(link).path)
+
+            if not is_zipfile(file):
+                yield extension, partial(rewind, file)
                 continue
 
-            resp = urlopen(label)
-            content = resp.read()
-            try:
-                with ZipFile(BytesIO(content)) as zipfile:
-                    for filename in zipfile.namelist():
+            zipfile = stack.enter_context(ZipFile(file))
+
+            for info in zipfile.infolist():
+                if info.is_dir():
+                    continue
+
+                yield (
+                    os.path.splitext(info.filename)[1],
+                    partial(zipfile.open, info)
+                )
+
+    def save_label(self, labels):
+        links = [
+            label for label in labels
+            if os.path.splitext(urlparse(label).path)[1]
+        ]
+
+        files = download_all(links)
+
+        # As partes extras da consulta anterior dão lugar às desta.
+        self.__order.extra_labels.all().delete()
+
+        with ExitStack() as stack:
+            for file in files:
+                stack.callback(file.close)
+
+            parts = list(self.label_parts(links, files, stack))
+            zpl = [
+                opener for extension, opener in parts
+                if extension.lower() in self.ZPL_EXTENSIONS
+            ]
+            others = [
+                (extension, opener) for extension, opener in parts
+                if extension.lower() not in self.ZPL_EXTENSIONS
+            ]
+
+            # Etiquetas ZPL de vários volumes são concatenadas em um único
+            # arquivo, copiado membro a membro sem passar por memória.
+            if zpl:
+                self.generate_file(
+                    File(BufferedReader(
+                        ConcatenatedReader(zpl),
+                        STREAM_CHUNK_SIZE
+                    )),
+                    f'{self.__order.number}.zpl'
+                )
+
+            for index, (extension, opener) in enumerate(others):
+                with opener() as content:
+                    if index == 0 and not zpl:
                         self.generate_file(
-                            zipfile.read(filename).decode(),
-                            filename
+                            File(content),
+                            f'{self.__order.number}{extension}'
                         )
-            except BadZipfile:
-                filename = f'{self.__order.number}{extension}'
-                self.generate_file(content, filename)
+                    else:
+                        self.save_extra_file(File(content), index, extension)
 
     def save(self, serializer: ResponseSerializer):
         logger.info(f'Create xml file by order {self.__order}')
@@ -312,10 +461,6 @@ class SaveLabelOrder(BaseOperation):
 
         self.save_label(serializer.labels)
 
-        SendRequestLabelToIntegrator(
-            self.__order
-        ).execute()
-
 
 class SaveExpeditionInfo(BaseOperation):
     RESOURCE = 'expedicao.obter.php'
@@ -343,14 +488,11 @@ class SaveExpeditionInfo(BaseOperation):
             update_fields=list(payload.keys())
         )
 
-        SaveLabelOrder(
-            self.configuration,
-            self.__order
-        ).execute()
-
 
 class SaveInvoiceFile(BaseOperation):
     RESOURCE = 'nota.fiscal.obter.xml.php'
+    # Suficiente para um `retorno` de erro do Tiny.
+    ERROR_SIZE = 8192
 
     def __init__(self, configuration, order):
         self.__order: Order = order
@@ -362,35 +504,75 @@ class SaveInvoiceFile(BaseOperation):
             id=self.__order.invoice_id
         )
 
-    def extract_content_invoice(self, content):
-        content = xmltodict.parse(content)
-        content = content.get('retorno').get('xml_nfe')
-
-        return xmltodict.unparse(content)
+    def extract_content_invoice(self, response: Response, output):
+        """
+        Copia o `retorno/xml_nfe` da resposta para `output` enquanto ela é
+        recebida, sem carregar o documento inteiro em memória.
+        """
+        chunks = HeadRecorder(
+            response.iter_content(STREAM_CHUNK_SIZE),
+            self.ERROR_SIZE
+        )
 
-    def save(self, serializer: ResponseSerializer):
+        try:
+            found = extract_element(chunks, 'xml_nfe', output)
+        except RequestException as error:
+            raise TransientError(
+                f'Connection error by Tiny: {error}'
+            ) from error
+
+        if not found:
+            self.raise_error(response, bytes(chunks.head))
+
+    def raise_error(self, response: Response, content: bytes):
+        """
+        Sem `xml_nfe`, a resposta deve ser um `retorno` de erro em XML:
+        ele é classificado como nas demais operações, para que bloqueios
+        cheguem ao limiter e a etapa seja repetida.
+        """
+        head = Response()
+        head.status_code = response.status_code
+        head.headers = response.headers
+        head._content = content
+
+        self.serializer(head)
+
+        raise OperationError('Invoice XML not found in Tiny response')
+
+    def save(self, file: File):
         logger.info(f'Create xml file by order {self.__order}')
 
         filename = f'NFE_{self.__order.number}.xml'
-        self.__order.xml.save(
+        self.__order.save_file(
+            'xml',
             os.path.join(
                 self.__order.configuration.name,
                 filename
             ),
-            ContentFile(
-                self.extract_content_invoice(
-                    serializer.data
-                )
-            )
+            file
         )
 
         self.__order.update_status(
             Order.AWAITING_INTEGRATION
         )
 
-        SendRequestToIntegrator(
-            self.__order
-        ).execute()
+    def execute(self):
+        check_deadline(self.__class__.__name__)
+
+        response = self.send(self.params, stream=True)
+
+        with closing(response), TemporaryFile() as output:
+            # Erros do Tiny chegam em JSON mesmo neste recurso.
+            if 'json' in response.headers.get('content-type', ''):
+                self.serializer(response)
+
+                raise OperationError('Invoice XML not found in Tiny response')
+
+            self.extract_content_invoice(response, output)
+            self.client.limiter.succeeded()
+
+            output.seek(0)
+            self.save(File(output))
 
 
 class SaveInvoice(BaseOperation):
@@ -424,7 +606,18 @@ class SaveInvoice(BaseOperation):
         logger.info(f'Save invoice by order {self.__order}')
 
         payload = serializer.invoice
+        invoice_fingerprint = fingerprint(
+            payload,
+            self.configuration.use_invoice_items
+        )
 
+        if invoice_fingerprint == self.__order.invoice_fingerprint:
+            logger.info(f'Invoice of order {self.__order} unchanged')
+        else:
+            self.update_invoice(payload, invoice_fingerprint)
+
+    def update_invoice(self, payload, invoice_fingerprint):
+        payload = dict(payload)
         items = payload.pop('items')
 
         for field, value in payload.items():
@@ -435,14 +628,9 @@ class SaveInvoice(BaseOperation):
 
             self.__order.products = len(items)
 
+        self.__order.invoice_fingerprint = invoice_fingerprint
         self.__order.save()
 
-        if self.__order.is_save_xml():
-            SaveInvoiceFile(
-                self.configuration,
-                self.__order
-            ).execute()
-
 
 class UpdateOrder(BaseOperation):
     RESOURCE = 'pedido.obter.php'
@@ -467,6 +655,7 @@ class UpdateOrder(BaseOperation):
         OrderItems.objects.bulk_create(bulk_items)
 
     def save_customer(self, customer: dict):
+        customer = dict(customer)
         instance, created = Customer.objects.update_or_create(
             cnpj_cpf=customer.pop('cnpj_cpf'),
             postal_code=customer.pop('postal_code'),
@@ -485,6 +674,21 @@ class UpdateOrder(BaseOperation):
         logger.info(f"Update order {self.__order}")
 
         payload = serializer.order
+        order_fingerprint = fingerprint(
+            payload,
+            self.configuration.use_invoice_items
+        )
+
+        if (
+            order_fingerprint == self.__order.order_fingerprint
+            and self.__order.status == Order.AWAITING_FILES
+        ):
+            logger.info(f'Order {self.__order} unchanged')
+        else:
+            self.update_order(payload, order_fingerprint)
+
+    def update_order(self, payload, order_fingerprint):
+        payload = dict(payload)
         customer = self.save_customer(
             payload.pop('customer')
         )
@@ -505,26 +709,9 @@ class UpdateOrder(BaseOperation):
             False
         )
 
+        self.__order.order_fingerprint = order_fingerprint
         self.__order.save()
 
-        try:
-            SaveInvoice(
-                configuration=self.configuration,
-                order=self.__order
-            ).execute()
-        except OperationError as error:
-            logger.warning(
-                f'[Save Invoice - {self.__order}] - {error}'
-            )
-
-    def execute(self):
-        try:
-            super(UpdateOrder, self).execute()
-        except OperationError as error:
-            logger.warning(
-                f'[Update Order - {self.__order}] - {error}'
-            )
-
 
 class GetCancelledOrders(BaseOperation):
     RESOURCE = 'pedidos.pesquisa.php'
@@ -560,11 +747,19 @@ class GetCancelledOrders(BaseOperation):
                 f"{self.configuration}"
             )
 
-            for order in orders:
+            pending = SendCancelationBatchToIntegrator(
+                self.configuration,
+                orders
+            ).execute()
+
+            for order in pending:
                 SendRequestCancelationToIntegrator(
                     order
                 ).execute()
 
+            for order in orders:
+                invalidate_order_cache(Order, order)
+
             orders.update(status=Order.CANCELLED)
 
         logger.info(f"End of search for canceled orders")
@@ -573,6 +768,13 @@ class GetCancelledOrders(BaseOperation):
 class SaveOrders(BaseOperation):
     RESOURCE = 'pedidos.pesquisa.php'
 
+    def __init__(self, configuration, pages=None):
+        self.pages: List[int] = pages or []
+        self.failed_pages: List[int] = []
+        self.attempted = 0
+
+        super().__init__(configuration)
+
     def update_params(self):
         before = (
                 timezone.now() - timezone.timedelta(days=self.configuration.days)
@@ -582,74 +784,145 @@ class SaveOrders(BaseOperation):
         self.params.update(
             dataInicialOcorrencia=before,
             dataFinalOcorrencia=now,
-            sort="DESC"
+            sort="DESC",
+            pagina=1
         )
         if self.configuration.status:
             self.params.update(
-                situacao=self.configuration.status,
-                pagina=1
+                situacao=self.configuration.status
             )
 
-    def save(self, serializer: ResponseSerializer):
+    def fetch_page(self, page) -> ResponseSerializer:
+        return self.serializer(
+            self.send({**self.params, 'pagina': page})
+        )
+
+    def fetch_pages(self, pages):
+        with ThreadPoolExecutor(
+            max_workers=SYNC_ORDERS_CONCURRENCY
+        ) as executor:
+            futures = {
+                executor.submit(copy_context().run, self.fetch_page, page):
+                    page
+                for page in pages
+            }
+
+            for future in as_completed(futures):
+                page = futures[future]
+
+                try:
+                    serializer = future.result()
+                except OperationError as error:
+                    logger.warning(
+                        f'[{self.configuration}] - Sync orders in '
+                        f'pagination {page}: {error}'
+                    )
+                    self.failed_pages.append(page)
+                    continue
+                except Exception:
+                    logger.exception(
+                        f'[{self.configuration}] - Sync orders in '
+                        f'pagination {page} failed unexpectedly'
+                    )
+                    self.failed_pages.append(page)
+                    continue
+
+                self.save(serializer)
+                logger.info(
+                    f"Sync order in pagination {page} of {serializer.pages}"
+                )
+
+    def execute(self):
+        check_deadline(self.__class__.__name__)
+
         logger.info('Starting an order sync...')
 
-        orders = serializer.orders
+        pages = self.pages
 
-        for informations_order in orders:
-            order = Order(
-                number=informations_order.pop('number'),
-                number_store=informations_order.pop('number_store'),
-                configuration=self.configuration,
-                **informations_order
-            )
+        if not pages:
+            serializer = self.fetch_page(1)
+            self.save(serializer)
 
-            Order.objects.get_or_create(
-                number=order.number,
-                number_store=order.number_store,
-                configuration=self.configuration,
-                defaults=informations_order
-            )
+            pages = range(2, serializer.pages + 1)
 
-        page_now = self.params.get('pagina', 1)
+        self.fetch_pages(pages)
 
-        if page_now < serializer.pages:
-            page_next = page_now + 1
-            self.params.update(
-                situacao=self.configuration.status,
-                pagina=page_next
+        if self.failed_pages:
+            logger.warning(
+                f'[{self.configuration}] - Sync orders failed in '
+                f'paginations {sorted(self.failed_pages)}'
             )
-            self.execute()
-            logger.info(
-                f"Sync order in pagination {page_next} of {serializer.pages}"
+
+        logger.info(
+            f"Sync finished with {self.attempted} new orders attempted"
+        )
+
+    def existing_keys(self, numbers):
+        lookup = Q(number__in=[number for number in numbers if number])
+
+        if None in numbers:
+            lookup |= Q(number__isnull=True)
+
+        return set(
+            Order.objects.filter(
+                lookup,
+                configuration=self.configuration
+            ).values_list('number', 'number_store')
+        )
+
+    def save(self, serializer: ResponseSerializer):
+        orders = {
+            (informations_order['number'], informations_order['number_store']):
+                informations_order
+            for informations_order in serializer.orders
+        }
+        existing = self.existing_keys(
+            {number for number, _ in orders}
+        )
+
+        new_orders = [
+            Order(
+                configuration=self.configuration,
+                search_label=self.configuration.search_labels,
+                **informations_order
             )
+            for key, informations_order in orders.items()
+            if key not in existing
+        ]
+
+        Order.objects.bulk_create(new_orders, ignore_conflicts=True)
 
-        logger.info(f"Sync finished with {len(orders)} orders saved")
+        # Com ignore_conflicts o banco descarta em silêncio os pedidos que
+        # outro processo inseriu depois da leitura acima, então o total é
+        # de pedidos enviados ao banco, não de pedidos efetivamente criados.
+        self.attempted += len(new_orders)
 
 
 class SendRequestBillingToIntegrator:
     def __init__(self, order: Order):
         self.__order = order
         self.__configuration = order.configuration
+        self.__client = IntegratorClient(self.__configuration)
+
+    @property
+    def filename(self):
+        return f'NFE_{self.__order.number}.xml'
 
     @property
     def payload(self):
-        return [
-            ('xml', self.__order.xml.open('rb'))
-        ]
+        return MultipartBody([
+            ('xml', self.filename, self.__order.xml)
+        ])
 
     def send_request(self):
-        resource = urljoin(
-            BASE_URL_INTEGRATOR,
-            f'orders/{self.__order.integrator_id}/billing'
-        )
-        headers = {
-            'Authorization': f'Token {self.__configuration.token_integrator}',
-        }
-        response = requests.post(
-            url=resource,
-            headers=headers,
-            files=self.payload
-        )
+        with self.payload as payload:
+            response = self.__client.post(
+                f'orders/{self.__order.integrator_id}/billing',
+                headers={'content-type': payload.content_type},
+                data=payload
+            )
+
+        check_integrator_response(response, 'billing')
 
         return response.content
 
@@ -657,36 +930,21 @@ class SendRequestBillingToIntegrator:
         if not self.__order.integrator_id:
             return
 
-        self.send_request()
-
-        try:
-            if self.__order.search_label:
-                SaveExpeditionInfo(
-                    self.__order.configuration,
-                    self.__order
-                ).execute()
+        check_deadline(self.__class__.__name__)
 
-        except OperationError as error:
-            logger.warning(f'[Save Expedition - {self.__order}] - {error}')
+        self.send_request()
 
 
 class SendRequestCancelationToIntegrator:
     def __init__(self, order: Order):
         self.__order = order
         self.__configuration = order.configuration
+        self.__client = IntegratorClient(self.__configuration)
 
     def send_request(self):
-        resource = urljoin(
-            BASE_URL_INTEGRATOR,
+        response = self.__client.post(
             f'orders/{self.__order.integrator_id}/cancelation'
         )
-        headers = {
-            'Authorization': f'Token {self.__configuration.token_integrator}',
-        }
-        response = requests.post(
-            url=resource,
-            headers=headers
-        )
 
         return response.content
 
@@ -697,9 +955,215 @@ class SendRequestCancelationToIntegrator:
         self.send_request()
 
 
+class SendBatchToIntegrator:
+    """
+    Envia vários pedidos de uma configuração ao integrador em uma única
+    requisição. A resposta tem um resultado por pedido, na ordem enviada,
+    com o status e o corpo que o envio individual teria recebido:
+
+        [{"status": 201, "body": {...}}, ...]
+
+    `execute` devolve os pedidos que ainda precisam do envio individual:
+    os que não entram no lote, os que falharam por instabilidade, os que
+    `accept` recusou e, se o integrador não tiver o recurso de lote, todos.
+    Nesse caso o lote deixa de ser tentado por INTEGRATOR_BATCH_RETRY_AFTER
+    segundos.
+
+    O lote é enviado como uma lista JSON montada por `payload`; lotes de
+    arquivos sobrescrevem `send_request` usando `send_files`, com uma parte
+    por pedido identificada pelo integrator_id.
+    """
+    RESOURCE: str = ''
+    UNSUPPORTED_STATUS_CODES = (404, 405, 501)
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    def __init__(self, configuration: Configuration, orders: List[Order]):
+        self.configuration = configuration
+        self.orders = list(orders)
+        self.client = IntegratorClient(self.configuration)
+
+    @property
+    def unsupported_key(self):
+        return f'{BATCH_UNSUPPORTED_KEY}:{self.RESOURCE}'
+
+    @property
+    def supported(self):
+        try:
+            return not get_redis().exists(self.unsupported_key)
+        except redis.RedisError as error:
+            logger.warning(f'Batch support unavailable: {error}')
+            return True
+
+    def set_unsupported(self):
+        logger.warning(
+            f'Integrator has no {self.RESOURCE}, sending orders one by one'
+        )
+
+        try:
+            get_redis().set(
+                self.unsupported_key,
+                1,
+                ex=INTEGRATOR_BATCH_RETRY_AFTER
+            )
+        except redis.RedisError as error:
+            logger.warning(f'Batch support unavailable: {error}')
+
+    def eligible(self, order: Order):
+        return bool(order.integrator_id)
+
+    def payload(self, orders: List[Order]):
+        return [order.integrator_id for order in orders]
+
+    def send_request(self, orders: List[Order]) -> Response:
+        return self.client.post(
+            self.RESOURCE,
+            headers={'content-type': 'application/json'},
+            data=json.dumps(self.payload(orders))
+        )
+
+    def send_files(self, files) -> Response:
+        with MultipartBody(files) as payload:
+            return self.client.post(
+                self.RESOURCE,
+                headers={'content-type': payload.content_type},
+                data=payload
+            )
+
+    def accept(self, order: Order, status_code, content):
+        # Pedidos recusados voltam para o envio individual.
+        if not 200 <= status_code < 300:
+            raise OperationError(f'Integrator responded {status_code}')
+
+    def results(self, response: Response, orders: List[Order]):
+        if response.status_code in self.UNSUPPORTED_STATUS_CODES:
+            self.set_unsupported()
+            return None
+
+        try:
+            results = response.json()
+        except ValueError:
+            results = None
+
+        if (
+            not 200 <= response.status_code < 300
+            or not isinstance(results, list)
+            or len(results) != len(orders)
+        ):
+            logger.warning(
+                f'[{self.configuration}] - Unexpected response of '
+                f'{self.RESOURCE} with status {response.status_code}'
+            )
+            return None
+
+        return results
+
+    def execute(self) -> List[Order]:
+        orders = [order for order in self.orders if self.eligible(order)]
+
+        if len(orders) < 2 or not self.supported:
+            return self.orders
+
+        check_deadline(self.__class__.__name__)
+
+        with closing(self.send_request(orders)) as response:
+            results = self.results(response, orders)
+
+        if results is None:
+            return self.orders
+
+        accepted = set()
+
+        for order, result in zip(orders, results):
+            if not isinstance(result, dict):
+                continue
+
+            status_code = result.get('status')
+
+            if not status_code or status_code in self.RETRY_STATUS_CODES:
+                continue
+
+            try:
+                self.accept(order, status_code, result.get('body') or {})
+            except OperationError as error:
+                logger.warning(f'[Order {order}] - {self.RESOURCE}: {error}')
+                continue
+
+            accepted.add(order.id)
+
+        logger.info(
+            f'[{self.configuration}] - {len(accepted)} of {len(orders)} '
+            f'orders sent by {self.RESOURCE}'
+        )
+
+        return [order for order in self.orders if order.id not in accepted]
+
+
+class SendOrdersBatchToIntegrator(SendBatchToIntegrator):
+    RESOURCE = 'orders/simple/batch'
+
+    def eligible(self, order: Order):
+        return not order.integrator_id
+
+    def payload(self, orders: List[Order]):
+        return [SendRequestToIntegrator(order).data for order in orders]
+
+    def accept(self, order: Order, status_code, content):
+        SendRequestToIntegrator(order).handle(status_code, content)
+
+
+class SendBillingBatchToIntegrator(SendBatchToIntegrator):
+    RESOURCE = 'orders/billing/batch'
+
+    def eligible(self, order: Order):
+        return bool(order.integrator_id and order.xml)
+
+    def send_request(self, orders: List[Order]) -> Response:
+        return self.send_files([
+            (
+                str(order.integrator_id),
+                SendRequestBillingToIntegrator(order).filename,
+                order.xml
+            )
+            for order in orders
+        ])
+
+
+class SendLabelsBatchToIntegrator(SendBatchToIntegrator):
+    RESOURCE = 'orders/attachment/batch'
+
+    def eligible(self, order: Order):
+        # O lote leva um arquivo por pedido; pedidos com partes extras
+        # seguem pelo envio individual, que manda todas.
+        return bool(
+            order.integrator_id
+            and order.label
+            and not order.extra_labels.exists()
+        )
+
+    def send_request(self, orders: List[Order]) -> Response:
+        return self.send_files([
+            (
+                str(order.integrator_id),
+                SendRequestLabelToIntegrator(order).filename,
+                order.label
+            )
+            for order in orders
+        ])
+
+    def accept(self, order: Order, status_code, content):
+        super().accept(order, status_code, content)
+
+        order.set_sent_label()
+
+
+class SendCancelationBatchToIntegrator(SendBatchToIntegrator):
+    RESOURCE = 'orders/cancelation/batch'
+
+
 class GetProcessedOrderInIntegrator:
     def __init__(self, configuration: Configuration):
         self.__configuration = configuration
+        self.__client = IntegratorClient(self.__configuration)
         self.__page = 1
 
     def get_order(self, payload):
@@ -715,16 +1179,9 @@ class GetProcessedOrderInIntegrator:
         return order
 
     def send_request(self):
-        resource = urljoin(
-            BASE_URL_INTEGRATOR,
-            f'orders?status__in=14&page={self.__page}&days=7'
-        )
-        headers = {
-            'Authorization': f'Token {self.__configuration.token_integrator}',
-        }
-        response = requests.get(
-            url=resource,
-            headers=headers
+        response = self.__client.get(
+            'orders',
+            params={'status__in': 14, 'page': self.__page, 'days': 7}
         )
 
         if response and response.status_code == 200:
@@ -765,3 +1222,35 @@ class GetProcessedOrderInIntegrator:
 
     def execute(self):
         self.get_orders()
+
+
+def order_cache_key(order: Order, resource, **params):
+    """
+    Chave de cache de uma consulta do pedido, com os mesmos parâmetros que a
+    operação montaria.
+    """
+    return ResponseCache.key(
+        order.configuration_id,
+        resource,
+        dict(formato='json', **params)
+    )
+
+
+@receiver(order_status_changed)
+def invalidate_order_cache(sender, instance: Order, **kwargs):
+    queries = (
+        (UpdateOrder.RESOURCE, dict(id=instance.identifier)),
+        (SaveInvoice.RESOURCE, dict(id=instance.invoice_id)),
+        (
+            SaveExpeditionInfo.RESOURCE,
+            dict(idObjeto=instance.invoice_id, tipoObjeto='notafiscal')
+        ),
+    )
+    keys = [
+        order_cache_key(instance, resource, **params)
+        for resource, params in queries
+        if TINY_CACHE_TTL.get(resource)
+    ]
+
+    get_response_cache().delete(*keys)
+
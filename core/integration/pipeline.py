@@ -0,0 +1,367 @@
+import time
+from collections import defaultdict
+from typing import Callable, Dict, List, Type
+
+import redis
+from django.db import transaction
+from django.db.models import Count
+
+from core import logger
+from core.integration.client import get_redis
+from core.integration.deadline import Deadline
+from core.integration.exceptions import (CircuitOpenError, OperationError,
+                                         RateLimitError, ThrottledError,
+                                         TransientError)
+from core.integration.operations import (BaseOperation, SaveExpeditionInfo,
+                                         SaveInvoice, SaveInvoiceFile,
+                                         SaveLabelOrder,
+                                         SendBatchToIntegrator,
+                                         SendBillingBatchToIntegrator,
+                                         SendLabelsBatchToIntegrator,
+                                         SendOrdersBatchToIntegrator,
+                                         SendRequestBillingToIntegrator,
+                                         SendRequestLabelToIntegrator,
+                                         SendRequestToIntegrator, UpdateOrder)
+from core.integration.resilience import RetryPolicy
+from core.managers import worker_identity
+from core.models import LeaseLost, Order
+from integration_tiny.celery import app
+from integration_tiny.settings import (INTEGRATOR_BATCH_SIZE,
+                                       PIPELINE_RETRY_ATTEMPTS,
+                                       PIPELINE_RETRY_BACKOFF,
+                                       PIPELINE_RETRY_MAX_BACKOFF)
+
+METRICS_KEY = 'pipeline:metrics'
+
+# Erros que passam com o tempo: a etapa volta para a fila com backoff em
+# vez de devolver o pedido para os dispatchers.
+RETRYABLE_ERRORS = (
+    ThrottledError,
+    TransientError,
+    RateLimitError,
+    CircuitOpenError,
+)
+
+STAGE_OPERATIONS: Dict[str, Type] = {
+    Order.STAGE_ORDER: UpdateOrder,
+    Order.STAGE_INVOICE: SaveInvoice,
+    Order.STAGE_INVOICE_FILE: SaveInvoiceFile,
+    Order.STAGE_INTEGRATION: SendRequestToIntegrator,
+    Order.STAGE_BILLING: SendRequestBillingToIntegrator,
+    Order.STAGE_EXPEDITION: SaveExpeditionInfo,
+    Order.STAGE_LABEL: SaveLabelOrder,
+    Order.STAGE_SEND_LABEL: SendRequestLabelToIntegrator,
+}
+
+STAGE_TASKS: Dict[str, str] = {
+    Order.STAGE_ORDER: 'core.tasks.task_update_order',
+    Order.STAGE_INVOICE: 'core.tasks.task_save_invoice',
+    Order.STAGE_INVOICE_FILE: 'core.tasks.task_save_invoice_file',
+    Order.STAGE_INTEGRATION: 'core.tasks.task_send_order_to_integrador',
+    Order.STAGE_BILLING: 'core.tasks.task_send_billing_to_integrador',
+    Order.STAGE_EXPEDITION: 'core.tasks.task_search_expedition',
+    Order.STAGE_LABEL: 'core.tasks.task_save_label',
+    Order.STAGE_SEND_LABEL: 'core.tasks.task_send_label_to_integrador',
+}
+
+# Etapas que podem ser enviadas ao integrador em lote. Os pedidos que o
+# lote não resolver seguem pelas tasks individuais de STAGE_TASKS.
+BATCH_OPERATIONS: Dict[str, Type[SendBatchToIntegrator]] = {
+    Order.STAGE_INTEGRATION: SendOrdersBatchToIntegrator,
+    Order.STAGE_BILLING: SendBillingBatchToIntegrator,
+    Order.STAGE_SEND_LABEL: SendLabelsBatchToIntegrator,
+}
+
+BATCH_TASK = 'core.tasks.task_send_batch_to_integrador'
+
+# Próxima etapa de acordo com o estado do pedido depois da etapa atual.
+# Pedidos em `idle` voltam a ser buscados pelos dispatchers do beat.
+TRANSITIONS: Dict[str, Callable[[Order], str]] = {
+    Order.STAGE_ORDER: lambda order: (
+        Order.STAGE_INVOICE if order.invoice_id else Order.STAGE_IDLE
+    ),
+    Order.STAGE_INVOICE: lambda order: (
+        Order.STAGE_INVOICE_FILE if order.is_save_xml() else Order.STAGE_IDLE
+    ),
+    Order.STAGE_INVOICE_FILE: lambda order: Order.STAGE_INTEGRATION,
+    Order.STAGE_INTEGRATION: lambda order: (
+        Order.STAGE_BILLING
+        if order.integrator_id and order.status == Order.IMPORTED
+        else Order.STAGE_IDLE
+    ),
+    Order.STAGE_BILLING: lambda order: (
+        Order.STAGE_EXPEDITION if order.search_label else Order.STAGE_DONE
+    ),
+    Order.STAGE_EXPEDITION: lambda order: Order.STAGE_LABEL,
+    Order.STAGE_LABEL: lambda order: (
+        Order.STAGE_SEND_LABEL if order.label else Order.STAGE_IDLE
+    ),
+    Order.STAGE_SEND_LABEL: lambda order: Order.STAGE_DONE,
+}
+
+
+def build_operation(stage, order: Order):
+    operation = STAGE_OPERATIONS[stage]
+
+    if issubclass(operation, BaseOperation):
+        return operation(order.configuration, order)
+
+    return operation(order)
+
+
+class StageMetrics:
+    """
+    Contadores por etapa compartilhados pelos workers, para comparar a
+    vazão e o tempo gasto em cada uma.
+    """
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    RETRIED = 'retried'
+
+    def __init__(self, connection: redis.Redis):
+        self.connection = connection
+
+    def record(self, stage, outcome, seconds=None, count=1):
+        try:
+            pipe = self.connection.pipeline()
+            pipe.hincrby(METRICS_KEY, f'{stage}:{outcome}', count)
+
+            if seconds is not None:
+                pipe.hincrbyfloat(METRICS_KEY, f'{stage}:seconds', seconds)
+
+            pipe.execute()
+        except redis.RedisError as error:
+            logger.warning(f'Pipeline metrics unavailable: {error}')
+
+
+def get_metrics() -> StageMetrics:
+    return StageMetrics(get_redis())
+
+
+def enqueue(order: Order, stage):
+    order.set_stage(stage, worker_identity())
+
+    if stage in Order.TERMINAL_STAGES:
+        return
+
+    transaction.on_commit(
+        app.signature(
+            STAGE_TASKS[stage],
+            args=(order.id, order.lease_owner)
+        ).delay
+    )
+
+
+def is_batch_stage(stage):
+    return stage in BATCH_OPERATIONS and INTEGRATOR_BATCH_SIZE > 1
+
+
+def dispatch(ids: List[int], stage, owner=None):
+    for _id in ids:
+        transaction.on_commit(
+            app.signature(STAGE_TASKS[stage], args=(_id, owner)).delay
+        )
+
+
+def dispatch_batches(ids: List[int], stage, owner=None):
+    """
+    Agrupa os pedidos em lotes de até INTEGRATOR_BATCH_SIZE da mesma
+    configuração, já que cada lote usa o token de uma só.
+    """
+    configurations = dict(
+        Order.objects.filter(id__in=ids).values_list('id', 'configuration_id')
+    )
+    batches = defaultdict(list)
+
+    def send(batch):
+        transaction.on_commit(
+            app.signature(BATCH_TASK, args=(stage, list(batch), owner)).delay
+        )
+        batch.clear()
+
+    for _id in ids:
+        if _id not in configurations:
+            continue
+
+        batch = batches[configurations[_id]]
+        batch.append(_id)
+
+        if len(batch) >= INTEGRATOR_BATCH_SIZE:
+            send(batch)
+
+    for batch in batches.values():
+        if batch:
+            send(batch)
+
+
+def enqueue_many(ids: List[int], stage, owner=None):
+    """
+    Coloca pedidos já reservados pelos dispatchers na etapa, mantendo a
+    ordem recebida.
+    """
+    Order.objects.filter(id__in=ids).update(stage=stage)
+
+    if is_batch_stage(stage):
+        dispatch_batches(ids, stage, owner)
+    else:
+        dispatch(ids, stage, owner)
+
+
+def run_stage(order: Order, stage, owner=None):
+    """
+    Executa a operação da etapa e encaminha o pedido para a próxima.
+
+    O lease é renovado antes de começar: se outro dispatcher reservou o
+    pedido depois que esta task foi enfileirada, LeaseLost interrompe a
+    etapa aqui, sem executar a operação.
+    """
+    order.check_lease(owner)
+    order.set_stage(stage, worker_identity())
+
+    started = time.monotonic()
+
+    with Deadline():
+        build_operation(stage, order).execute()
+
+    get_metrics().record(
+        stage,
+        StageMetrics.SUCCEEDED,
+        time.monotonic() - started
+    )
+
+    enqueue(order, TRANSITIONS[stage](order))
+
+
+def run_batch_stage(ids: List[int], stage, owner=None):
+    """
+    Envia a etapa dos pedidos em lote. Os que o lote resolveu seguem para a
+    próxima etapa (em lote, quando ela também for), os demais são
+    reenviados pelas tasks individuais da mesma etapa.
+    """
+    started = time.monotonic()
+
+    loaded = Order.objects.select_related('configuration').in_bulk(ids)
+    orders = []
+
+    for _id in ids:
+        if _id not in loaded:
+            continue
+
+        try:
+            loaded[_id].check_lease(owner)
+            loaded[_id].set_stage(stage, worker_identity())
+        except LeaseLost as error:
+            logger.info(f'Stage {stage} in batch: {error}')
+            continue
+
+        orders.append(loaded[_id])
+
+    groups = defaultdict(list)
+    for order in orders:
+        groups[order.configuration_id].append(order)
+
+    pending = []
+    for group in groups.values():
+        try:
+            with Deadline():
+                pending += BATCH_OPERATIONS[stage](
+                    group[0].configuration,
+                    group
+                ).execute()
+        except OperationError as error:
+            logger.warning(f'Stage {stage} in batch: {error}')
+            pending += group
+
+    pending_ids = {order.id for order in pending}
+    sent = [order for order in orders if order.id not in pending_ids]
+
+    if sent:
+        get_metrics().record(
+            stage,
+            StageMetrics.SUCCEEDED,
+            time.monotonic() - started,
+            count=len(sent)
+        )
+
+    dispatch([order.id for order in pending], stage, owner)
+
+    transitions = defaultdict(list)
+    for order in sent:
+        transitions[TRANSITIONS[stage](order)].append(order)
+
+    for next_stage, group in transitions.items():
+        batch = []
+
+        for order in group:
+            try:
+                if is_batch_stage(next_stage):
+                    order.set_stage(next_stage, worker_identity())
+                    batch.append(order.id)
+                else:
+                    enqueue(order, next_stage)
+            except LeaseLost as error:
+                logger.info(f'Stage {stage} in batch: {error}')
+
+        if batch:
+            dispatch_batches(batch, next_stage, owner)
+
+
+def retry_stage(order: Order, stage, error: OperationError):
+    """
+    Devolve a etapa para a task individual do pedido, que continua as
+    tentativas com o backoff de retry_delay.
+    """
+    logger.info(f'[Order {order}] - Stage {stage}: {error}, retrying')
+
+    get_metrics().record(stage, StageMetrics.RETRIED)
+
+    signature = app.signature(
+        STAGE_TASKS[stage],
+        args=(order.id, order.lease_owner),
+        countdown=retry_delay(0)
+    )
+    transaction.on_commit(signature.apply_async)
+
+
+def fail_stage(order: Order, stage, error: Exception):
+    logger.warning(f'[Order {order}] - Stage {stage}: {error}')
+
+    get_metrics().record(stage, StageMetrics.FAILED)
+
+    try:
+        order.set_stage(Order.STAGE_IDLE)
+    except LeaseLost as error:
+        logger.info(f'[Order {order}] - Stage {stage}: {error}')
+
+
+def retry_delay(retries) -> float:
+    return RetryPolicy(
+        PIPELINE_RETRY_ATTEMPTS,
+        PIPELINE_RETRY_BACKOFF,
+        PIPELINE_RETRY_MAX_BACKOFF
+    ).delay(retries)
+
+
+def pipeline_state(connection: redis.Redis):
+    """
+    Pedidos em cada etapa e os contadores reportados pelos workers.
+    """
+    state = {
+        stage: {'orders': 0}
+        for stage, _ in Order.STAGES
+    }
+
+    for row in Order.objects.values('stage').annotate(total=Count('id')):
+        state[row['stage']]['orders'] = row['total']
+
+    try:
+        reported = connection.hgetall(METRICS_KEY)
+    except redis.RedisError as error:
+        logger.warning(f'Pipeline metrics unavailable: {error}')
+        reported = {}
+
+    for field, value in reported.items():
+        stage, metric = field.decode().split(':', 1)
+        state.setdefault(stage, {'orders': 0})[metric] = float(value)
+
+    return state
@@ -0,0 +1,181 @@
+import json
+import random
+import threading
+import time
+from typing import Dict
+
+import redis
+
+from core import logger
+from core.integration.exceptions import CircuitOpenError
+from integration_tiny.settings import (CIRCUIT_BREAKER_RESET_TIMEOUT,
+                                       CIRCUIT_BREAKER_THRESHOLD,
+                                       HTTP_RETRY_ATTEMPTS, HTTP_RETRY_BACKOFF,
+                                       HTTP_RETRY_MAX_BACKOFF)
+
+BREAKERS_KEY = 'upstream:breakers'
+
+
+class RetryPolicy:
+    IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+    def __init__(
+        self,
+        attempts=HTTP_RETRY_ATTEMPTS,
+        backoff=HTTP_RETRY_BACKOFF,
+        max_backoff=HTTP_RETRY_MAX_BACKOFF
+    ):
+        self.attempts = max(attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def attempts_for(self, method):
+        if method.upper() in self.IDEMPOTENT_METHODS:
+            return self.attempts
+
+        return 1
+
+    def delay(self, attempt):
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt)
+        )
+
+    def sleep(self, attempt):
+        time.sleep(self.delay(attempt))
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        name,
+        connection: redis.Redis = None,
+        failure_threshold=CIRCUIT_BREAKER_THRESHOLD,
+        reset_timeout=CIRCUIT_BREAKER_RESET_TIMEOUT
+    ):
+        self.name = name
+        self.connection = connection
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.changed_at = None
+        self.trial_started_at = None
+        self.__lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Em HALF_OPEN só uma chamada de teste passa; as demais são recusadas
+        até ela terminar ou, se nunca for registrada, até reset_timeout.
+        """
+        with self.__lock:
+            now = time.time()
+
+            if self.state == self.CLOSED:
+                return
+
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.reset_timeout:
+                    raise CircuitOpenError(
+                        f'Circuit of {self.name} is open, skipping request'
+                    )
+
+                self.transition(self.HALF_OPEN)
+            elif now - self.trial_started_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    f'Circuit of {self.name} is half open, waiting for the '
+                    f'trial request'
+                )
+
+            self.trial_started_at = now
+
+    def record_success(self):
+        with self.__lock:
+            self.failures = 0
+
+            if self.state != self.CLOSED:
+                self.transition(self.CLOSED)
+
+    def record_failure(self):
+        with self.__lock:
+            self.failures += 1
+
+            if self.state == self.HALF_OPEN or (
+                self.failures >= self.failure_threshold
+            ):
+                self.opened_at = time.time()
+                self.transition(self.OPEN)
+
+    def transition(self, state):
+        logger.warning(
+            f'Circuit of {self.name} changed from {self.state} to {state}'
+        )
+        self.state = state
+        self.changed_at = time.time()
+        self.report()
+
+    def snapshot(self):
+        return dict(
+            name=self.name,
+            state=self.state,
+            failures=self.failures,
+            opened_at=self.opened_at,
+            changed_at=self.changed_at
+        )
+
+    def report(self):
+        if not self.connection:
+            return
+
+        try:
+            self.connection.hset(
+                BREAKERS_KEY,
+                self.name,
+                json.dumps(self.snapshot())
+            )
+        except redis.RedisError as error:
+            logger.warning(f'Circuit of {self.name} not reported: {error}')
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name, connection: redis.Redis = None) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name, connection)
+
+    return _breakers[name]
+
+
+def breakers_state(connection: redis.Redis):
+    """
+    Estado dos circuitos reportado por todos os processos, incluindo os
+    deste processo que ainda não mudaram de estado.
+    """
+    state = {
+        name: breaker.snapshot()
+        for name, breaker in _breakers.items()
+    }
+
+    try:
+        reported = connection.hgetall(BREAKERS_KEY)
+    except redis.RedisError as error:
+        logger.warning(f'Circuits state unavailable: {error}')
+        reported = {}
+
+    for name, snapshot in reported.items():
+        name, snapshot = name.decode(), json.loads(snapshot)
+        local = state.get(name, {})
+
+        if (local.get('changed_at') or 0) <= (snapshot['changed_at'] or 0):
+            state[name] = snapshot
+
+    return state
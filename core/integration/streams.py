@@ -0,0 +1,192 @@
+import io
+from typing import BinaryIO, Callable, Iterable
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="utf-8"?>\n'
+CDATA_START = b'<![CDATA['
+CDATA_END = b']]>'
+
+
+class ElementExtractor:
+    """
+    Copia o conteúdo de um elemento de um XML recebido em pedaços sem
+    montar a árvore do documento. Os bytes entre as tags de abertura e
+    fechamento são escritos em `output` exatamente como vieram, então
+    assinaturas e espaços do documento interno são preservados.
+
+    Se o conteúdo vier em uma seção CDATA ela é removida, e a declaração
+    XML é adicionada quando o documento interno não tiver uma.
+    """
+    SEARCH = 'search'
+    HEAD = 'head'
+    BODY = 'body'
+    COMPLETE = 'complete'
+
+    def __init__(self, tag, output: BinaryIO):
+        self.start_tag = f'<{tag}>'.encode()
+        self.end_tag = f'</{tag}>'.encode()
+        self.output = output
+        self.state = self.SEARCH
+        self.written = 0
+        self.__buffer = b''
+
+    @property
+    def complete(self):
+        return self.state == self.COMPLETE
+
+    def write(self, content):
+        self.output.write(content)
+        self.written += len(content)
+
+    def search(self):
+        index = self.__buffer.find(self.start_tag)
+
+        if index < 0:
+            self.__buffer = self.__buffer[-len(self.start_tag) + 1:]
+            return False
+
+        self.__buffer = self.__buffer[index + len(self.start_tag):]
+        self.state = self.HEAD
+
+        return True
+
+    def head(self, final=False):
+        content = self.__buffer.lstrip()
+        wanted = len(CDATA_START) + len(b'<?xml')
+
+        if (
+            len(content) < wanted
+            and self.end_tag not in content
+            and not final
+        ):
+            return False
+
+        if content.startswith(CDATA_START):
+            content = content[len(CDATA_START):].lstrip()
+            self.end_tag = CDATA_END
+
+        if not content.startswith(b'<?xml'):
+            self.write(XML_DECLARATION)
+
+        self.__buffer = content
+        self.state = self.BODY
+
+        return True
+
+    def body(self):
+        index = self.__buffer.find(self.end_tag)
+
+        if index >= 0:
+            self.write(self.__buffer[:index])
+            self.__buffer = b''
+            self.state = self.COMPLETE
+            return False
+
+        # Guarda o suficiente para reconhecer a tag de fechamento dividida
+        # entre dois pedaços.
+        keep = len(self.end_tag) - 1
+        if len(self.__buffer) > keep:
+            self.write(self.__buffer[:-keep])
+            self.__buffer = self.__buffer[-keep:]
+
+        return False
+
+    def feed(self, chunk: bytes):
+        if self.complete:
+            return
+
+        self.__buffer += chunk
+
+        while True:
+            if self.state == self.SEARCH and self.search():
+                continue
+            if self.state == self.HEAD and self.head():
+                continue
+            if self.state == self.BODY:
+                self.body()
+
+            break
+
+    def close(self):
+        if self.state == self.HEAD:
+            self.head(final=True)
+            self.body()
+
+        return self.complete
+
+
+class HeadRecorder:
+    """
+    Repassa os pedaços de um stream guardando os primeiros `size` bytes,
+    para que a resposta possa ser interpretada se não vier o esperado.
+    """
+
+    def __init__(self, chunks: Iterable[bytes], size):
+        self.__chunks = chunks
+        self.size = size
+        self.head = bytearray()
+
+    def __iter__(self):
+        for chunk in self.__chunks:
+            missing = self.size - len(self.head)
+
+            if missing > 0:
+                self.head += chunk[:missing]
+
+            yield chunk
+
+
+def extract_element(chunks: Iterable[bytes], tag, output: BinaryIO) -> bool:
+    extractor = ElementExtractor(tag, output)
+
+    for chunk in chunks:
+        extractor.feed(chunk)
+
+        if extractor.complete:
+            break
+
+    return extractor.close()
+
+
+def rewind(file: BinaryIO) -> BinaryIO:
+    file.seek(0)
+
+    return file
+
+
+class ConcatenatedReader(io.RawIOBase):
+    """
+    Lê vários streams em sequência como se fossem um só. Cada stream só é
+    aberto quando chega a vez dele e é fechado ao terminar.
+    """
+
+    def __init__(self, openers: Iterable[Callable[[], BinaryIO]]):
+        self.__openers = iter(openers)
+        self.__current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.__current is None:
+                opener = next(self.__openers, None)
+
+                if opener is None:
+                    return 0
+
+                self.__current = opener()
+
+            size = self.__current.readinto(buffer)
+
+            if size:
+                return size
+
+            self.__current.close()
+            self.__current = None
+
+    def close(self):
+        if self.__current is not None:
+            self.__current.close()
+            self.__current = None
+
+        super().close()
@@ -0,0 +1,92 @@
+import mimetypes
+import uuid
+from typing import BinaryIO, Iterator, List, Optional, Tuple
+
+from django.db.models.fields.files import FieldFile
+
+from integration_tiny.settings import STREAM_CHUNK_SIZE
+
+
+class MultipartBody:
+    """
+    Corpo multipart/form-data lido direto do storage em pedaços enquanto
+    é enviado. O tamanho é conhecido antes do envio, então a requisição
+    sai com Content-Length sem carregar os arquivos em memória.
+
+    Cada arquivo só fica aberto enquanto a parte dele é enviada; usado como
+    context manager, o arquivo em andamento é fechado mesmo se o envio for
+    interrompido.
+    """
+
+    def __init__(
+        self,
+        files: List[Tuple[str, str, FieldFile]],
+        chunk_size=STREAM_CHUNK_SIZE
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.parts = [
+            (self.part_header(field, filename), file)
+            for field, filename, file in files
+        ]
+        self.__current: Optional[BinaryIO] = None
+
+    @property
+    def content_type(self):
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def closing(self) -> bytes:
+        return f'--{self.boundary}--\r\n'.encode()
+
+    def part_header(self, field, filename) -> bytes:
+        content_type = (
+            mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        filename = filename.replace('"', '%22')
+
+        return (
+            f'--{self.boundary}\r\n'
+            f'Content-Disposition: form-data; name="{field}"; '
+            f'filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n'
+            '\r\n'
+        ).encode()
+
+    def __len__(self):
+        return sum(
+            len(header) + file.size + 2
+            for header, file in self.parts
+        ) + len(self.closing)
+
+    def __iter__(self) -> Iterator[bytes]:
+        for header, file in self.parts:
+            yield header
+
+            self.__current = file.storage.open(file.name, 'rb')
+
+            try:
+                while True:
+                    chunk = self.__current.read(self.chunk_size)
+
+                    if not chunk:
+                        break
+
+                    yield chunk
+            finally:
+                self.close()
+
+            yield b'\r\n'
+
+        yield self.closing
+
+    def close(self):
+        if self.__current is not None:
+            self.__current.close()
+            self.__current = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
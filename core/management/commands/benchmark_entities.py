@@ -0,0 +1,88 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from core.integration.entities import (InvoiceData, OrderData,
+                                       OrderResumeData, fingerprint)
+
+ITEM = {
+    'item': {
+        'codigo': 'P1',
+        'descricao': 'Produto',
+        'unidade': 'UN',
+        'quantidade': '2,000',
+        'valor_unitario': '10.50'
+    }
+}
+ORDER = {
+    'numero': '123',
+    'numero_ecommerce': 'E1',
+    'obs': 'obs - a\n b',
+    'id_nota_fiscal': 9,
+    'cliente': {
+        'nome': 'Fulano',
+        'cpf_cnpj': '12345678901',
+        'cep': '12345678',
+        'endereco': 'Rua',
+        'complemento': 'c',
+        'bairro': 'b',
+        'uf': 'sp',
+        'cidade': 'x',
+        'numero': '1'
+    },
+    'itens': [ITEM] * 50
+}
+INVOICE = {
+    'serie': '1',
+    'chave_acesso': 'k',
+    'numero': '5',
+    'situacao': '6',
+    'transportador': {'cpf_cnpj': '12345678000199'},
+    'itens': [ITEM] * 300
+}
+SEARCH_PAGE = [
+    {'pedido': {'id': index, 'numero': str(index), 'numero_ecommerce': 'x'}}
+    for index in range(100)
+]
+
+
+class Command(BaseCommand):
+    help = 'Mede o tempo de conversão das entidades do Tiny em dicionários'
+
+    CASES = {
+        'search page (100 orders)': lambda: [
+            OrderResumeData(order['pedido']).to_dict()
+            for order in SEARCH_PAGE
+        ],
+        'invoice items (300)': lambda: [
+            item.to_dict()
+            for item in InvoiceData(INVOICE).to_dict()['items']
+        ],
+        'order fingerprint (50 items)': lambda: fingerprint(
+            OrderData(ORDER).to_dict()
+        ),
+    }
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--number',
+            type=int,
+            default=20,
+            help='Execuções de cada caso por medição.'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Medições de cada caso; vale a melhor.'
+        )
+
+    def handle(self, *args, **options):
+        number = options['number']
+
+        for name, case in self.CASES.items():
+            best = min(
+                timeit.repeat(case, number=number, repeat=options['repeat'])
+            )
+
+            self.stdout.write(f'{name}: {best / number * 1000:.2f} ms')
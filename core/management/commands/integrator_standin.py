@@ -0,0 +1,323 @@
+import io
+import itertools
+import json
+import re
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.management.base import BaseCommand
+from django.http.multipartparser import MultiPartParser, MultiPartParserError
+
+ROUTES = (
+    ('GET', re.compile(r'(?:^|/)orders/?$'), 'get_orders'),
+    ('POST', re.compile(r'(?:^|/)orders/simple/?$'), 'create_order'),
+    ('POST', re.compile(r'(?:^|/)orders/simple/batch/?$'), 'create_orders'),
+    (
+        'POST',
+        re.compile(r'(?:^|/)orders/(\d+)/(billing|attachment|cancelation)/?$'),
+        'update_order'
+    ),
+    (
+        'POST',
+        re.compile(r'(?:^|/)orders/(billing|attachment|cancelation)/batch/?$'),
+        'update_orders'
+    ),
+)
+
+
+class StandInIntegrator(ThreadingHTTPServer):
+    """
+    Integrador em memória com os recursos usados pelos envios, individuais
+    e em lote. Com `batch=False` os recursos de lote respondem 404, como
+    um integrador que não os tem; com `fail_every` um a cada N pedidos de
+    um lote falha com 503.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, batch=True, fail_every=0):
+        super().__init__(address, StandInHandler)
+
+        self.batch = batch
+        self.fail_every = fail_every
+        self.orders = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        self.__ids = itertools.count(1)
+        self.__items = itertools.count(1)
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+
+        return f'http://{host}:{port}/'
+
+    def failed(self):
+        return bool(
+            self.fail_every and next(self.__items) % self.fail_every == 0
+        )
+
+    def find(self, token, order_number):
+        for order in self.orders.values():
+            if (
+                order['token'] == token
+                and order['order_number'] == order_number
+            ):
+                return order
+
+        return None
+
+    def create(self, token, payload):
+        if not isinstance(payload, dict) or not payload.get('order_number'):
+            return HTTPStatus.BAD_REQUEST, {
+                'order_number': ['This field is required.']
+            }
+
+        with self.lock:
+            if self.find(token, payload['order_number']):
+                return HTTPStatus.BAD_REQUEST, {
+                    'order_number': ['Order with this number already exists.']
+                }
+
+            order = dict(
+                payload,
+                id=next(self.__ids),
+                token=token,
+                status=1,
+                billing=[],
+                attachment=[],
+                cancelation=False
+            )
+            self.orders[order['id']] = order
+
+        return HTTPStatus.CREATED, {
+            'id': order['id'],
+            'order_number': order['order_number']
+        }
+
+    def update(self, token, _id, resource, file=None):
+        order = self.orders.get(_id)
+
+        if not order or order['token'] != token:
+            return HTTPStatus.NOT_FOUND, {'detail': 'Not found.'}
+
+        with self.lock:
+            if resource == 'cancelation':
+                order['cancelation'] = True
+            elif file is None:
+                return HTTPStatus.BAD_REQUEST, {
+                    resource: ['No file was submitted.']
+                }
+            else:
+                order[resource].append((file.name, file.size))
+
+        return HTTPStatus.OK, {'id': _id}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: StandInIntegrator
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def token(self):
+        authorization = self.headers.get('Authorization', '')
+
+        if not authorization.startswith('Token '):
+            return None
+
+        return authorization[len('Token '):]
+
+    def respond(self, status, content):
+        body = json.dumps(content).encode()
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        try:
+            return json.loads(self.body.getvalue() or b'null')
+        except ValueError:
+            return None
+
+    def read_files(self):
+        parser = MultiPartParser(
+            {
+                'CONTENT_TYPE': self.headers.get('Content-Type', ''),
+                'CONTENT_LENGTH': len(self.body.getvalue()),
+            },
+            self.body,
+            [TemporaryFileUploadHandler()]
+        )
+        _, files = parser.parse()
+
+        return files
+
+    def route(self, method):
+        path = urlparse(self.path).path
+
+        for route_method, pattern, name in ROUTES:
+            match = pattern.search(path)
+
+            if route_method == method and match:
+                return getattr(self, name), match.groups()
+
+        return None, ()
+
+    def dispatch(self, method):
+        # O corpo é lido inteiro mesmo quando não é usado, para que a
+        # conexão possa ser reaproveitada pelo cliente.
+        self.body = io.BytesIO(
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        )
+        action, arguments = self.route(method)
+
+        if action is None:
+            status, content = HTTPStatus.NOT_FOUND, {'detail': 'Not found.'}
+        elif not self.token:
+            status, content = HTTPStatus.UNAUTHORIZED, {
+                'detail': 'Authentication credentials were not provided.'
+            }
+        else:
+            try:
+                status, content = action(*arguments)
+            except MultiPartParserError as error:
+                status, content = HTTPStatus.BAD_REQUEST, {
+                    'detail': str(error)
+                }
+
+        self.server.requests.append((method, self.path, int(status)))
+        self.respond(status, content)
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def batch_disabled(self):
+        return not self.server.batch
+
+    def get_orders(self):
+        query = parse_qs(urlparse(self.path).query)
+        numbers = query.get('order_number', [])
+
+        results = [
+            {'id': order['id'], 'order_number': order['order_number']}
+            for order in self.server.orders.values()
+            if order['token'] == self.token and (
+                not numbers or str(order['order_number']) in numbers
+            )
+        ]
+
+        return HTTPStatus.OK, {'results': results, 'pages': 1}
+
+    def create_order(self):
+        return self.server.create(self.token, self.read_json())
+
+    def create_orders(self):
+        if self.batch_disabled():
+            return HTTPStatus.NOT_FOUND, {'detail': 'Not found.'}
+
+        payload = self.read_json()
+
+        if not isinstance(payload, list):
+            return HTTPStatus.BAD_REQUEST, {'detail': 'Expected a list.'}
+
+        return HTTPStatus.MULTI_STATUS, [
+            self.item(lambda: self.server.create(self.token, item))
+            for item in payload
+        ]
+
+    def update_order(self, _id, resource):
+        file = None
+
+        if resource != 'cancelation':
+            files = self.read_files()
+            file = files.get(
+                'xml' if resource == 'billing' else 'attachment'
+            )
+
+        return self.server.update(self.token, int(_id), resource, file)
+
+    def update_orders(self, resource):
+        if self.batch_disabled():
+            return HTTPStatus.NOT_FOUND, {'detail': 'Not found.'}
+
+        if resource == 'cancelation':
+            payload = self.read_json()
+
+            if not isinstance(payload, list):
+                return HTTPStatus.BAD_REQUEST, {'detail': 'Expected a list.'}
+
+            items = [(_id, None) for _id in payload]
+        else:
+            items = [
+                (_id, file)
+                for _id, file in self.read_files().items()
+            ]
+
+        return HTTPStatus.MULTI_STATUS, [
+            self.item(
+                lambda _id=_id, file=file: self.server.update(
+                    self.token, int(_id), resource, file
+                )
+            )
+            for _id, file in items
+        ]
+
+    def item(self, action):
+        if self.server.failed():
+            return {
+                'status': HTTPStatus.SERVICE_UNAVAILABLE,
+                'body': {'detail': 'Service unavailable.'}
+            }
+
+        status, body = action()
+
+        return {'status': int(status), 'body': body}
+
+
+class Command(BaseCommand):
+    help = (
+        'Sobe um integrador local, em memória, para testar os envios de '
+        'pedidos, notas, etiquetas e cancelamentos.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=9999)
+        parser.add_argument(
+            '--no-batch',
+            action='store_true',
+            help='Responde 404 nos recursos de lote.'
+        )
+        parser.add_argument(
+            '--fail-every',
+            type=int,
+            default=0,
+            help='Falha com 503 um a cada N pedidos enviados em lote.'
+        )
+
+    def handle(self, *args, **options):
+        server = StandInIntegrator(
+            (options['host'], options['port']),
+            batch=not options['no_batch'],
+            fail_every=options['fail_every']
+        )
+
+        self.stdout.write(f'Integrator stand-in listening on {server.url}')
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -1,15 +1,39 @@
-from django.db.models import Manager
+import os
+import socket
+import uuid
+from typing import List
+
+from django.db import connections, transaction
+from django.db.models import Manager, Q
+from django.utils import timezone
+
+from integration_tiny.settings import ORDER_LEASE_SECONDS
+
+
+def worker_identity():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def claim_owner():
+    # Único por reserva: duas reservas do mesmo processo não se confundem.
+    return f'{worker_identity()}:{uuid.uuid4().hex[:8]}'
 
 
 class OrderManager(Manager):
+    @staticmethod
+    def available(now=None):
+        now = now or timezone.now()
+
+        return Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+
     def search_expedition(self):
         queryset = self.get_queryset()
 
         queryset = queryset.filter(
+            self.available(),
             label__in=['', None],
             status=self.model.IMPORTED,
             search_label=True,
-            running=False,
             configuration__is_active=True
         ).exclude(
             status=self.model.CANCELLED,
@@ -23,9 +47,9 @@ class OrderManager(Manager):
         queryset = self.get_queryset()
 
         queryset = queryset.filter(
+            self.available(),
             xml__in=['', None],
             status=self.model.AWAITING_FILES,
-            running=False,
             configuration__is_active=True
         ).exclude(
             status=self.model.CANCELLED
@@ -38,16 +62,99 @@ class OrderManager(Manager):
     def pending_send_labels(self):
         queryset = self.get_queryset()
 
+        # Condições positivas em `status` e `label` para que o banco use
+        # o índice order_pending_label_idx em vez de percorrer a tabela.
         queryset = queryset.filter(
+            status__in=[
+                status for status, _ in self.model.STATUS
+                if status != self.model.CANCELLED
+            ],
+            label__gt='',
             search_label=True,
             sent_label=False,
+            processed=False,
             configuration__is_active=True
-        ).exclude(
-            processed=True
-        ).exclude(
-            status=self.model.CANCELLED
-        ).exclude(
-            label__in=['', None]
         )
 
         return queryset
+
+    def search_awaiting_integration(self):
+        queryset = self.get_queryset()
+
+        queryset = queryset.filter(
+            self.available(),
+            status=self.model.AWAITING_INTEGRATION
+        )
+
+        return queryset
+
+    def claim(
+        self,
+        queryset,
+        limit=None,
+        owner=None,
+        lease_seconds=ORDER_LEASE_SECONDS
+    ) -> List[int]:
+        """
+        Reserva atomicamente até `limit` pedidos do queryset para `owner`
+        até o fim do lease. Pedidos com lease expirado voltam a ficar
+        disponíveis sem intervenção.
+
+        Usa SELECT ... FOR UPDATE SKIP LOCKED quando o banco suporta; nos
+        demais (SQLite) a atualização condicional garante que um pedido só
+        seja reservado por um dispatcher.
+        """
+        owner = owner or claim_owner()
+        now = timezone.now()
+        expires_at = now + timezone.timedelta(seconds=lease_seconds)
+        features = connections[self.db].features
+
+        queryset = queryset.filter(self.available(now))
+
+        with transaction.atomic(using=self.db):
+            if features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(
+                    skip_locked=True,
+                    of=('self',) if features.has_select_for_update_of else ()
+                )
+
+            ids = list(
+                queryset.values_list('id', flat=True)[:limit]
+            )
+
+            self.filter(
+                self.available(now),
+                id__in=ids
+            ).update(
+                lease_owner=owner,
+                lease_expires_at=expires_at
+            )
+
+        return list(
+            self.filter(
+                id__in=ids,
+                lease_owner=owner,
+                lease_expires_at=expires_at
+            ).values_list('id', flat=True)
+        )
+
+    def claim_per_configuration(self, queryset, limit, owner) -> List[int]:
+        """
+        Reserva até `limit` pedidos de cada configuração do queryset. O
+        backlog de um cliente grande é reservado aos poucos, em vez de
+        ficar inteiro na fila até o lease expirar.
+        """
+        configurations = queryset.order_by().values_list(
+            'configuration_id',
+            flat=True
+        ).distinct()
+
+        ids = []
+        for configuration_id in list(configurations):
+            ids += self.claim(
+                queryset.filter(configuration_id=configuration_id),
+                limit=limit,
+                owner=owner
+            )
+
+        return ids
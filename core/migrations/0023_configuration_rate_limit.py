@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_alter_customer_fantasy_name_alter_customer_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuration',
+            name='rate_limit',
+            field=models.PositiveIntegerField(default=30, help_text='Requests per minute allowed by the Tiny token'),
+        ),
+        migrations.AddField(
+            model_name='configuration',
+            name='rate_limit_burst',
+            field=models.PositiveIntegerField(default=5, help_text='Requests that can be sent at once before throttling'),
+        ),
+    ]
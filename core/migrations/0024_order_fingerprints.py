@@ -0,0 +1,23 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_configuration_rate_limit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='order_fingerprint',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:33
+
+from django.db import migrations, models
+from django.db.models import Q
+
+from core.migrations._duplicates import remove_duplicated_orders
+
+
+def remove_duplicated_orders_by_number(apps, schema_editor):
+    remove_duplicated_orders(
+        apps,
+        ('configuration', 'number', 'number_store'),
+        Q(number__isnull=False, number_store__isnull=False)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_order_fingerprints'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicated_orders_by_number,
+            reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('configuration', 'number', 'number_store'), name='unique_order_number_by_configuration'),
+        ),
+    ]
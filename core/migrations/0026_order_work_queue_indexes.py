@@ -0,0 +1,29 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_order_unique_number'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('running', False)), fields=['status'], name='order_idle_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('processed', False), ('running', False)), fields=['status', 'xml'], name='order_update_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('processed', False), ('running', False), ('search_label', True)), fields=['status', 'label'], name='order_expedition_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('processed', False), ('search_label', True), ('sent_label', False)), fields=['status', 'label'], name='order_pending_label_idx'),
+        ),
+    ]
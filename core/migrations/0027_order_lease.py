@@ -0,0 +1,51 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_order_work_queue_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_idle_status_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_update_queue_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_expedition_queue_idx',
+        ),
+        migrations.RemoveField(
+            model_name='order',
+            name='running',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='lease_owner',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'lease_expires_at'], name='order_status_lease_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('processed', False)), fields=['status', 'xml', 'lease_expires_at'], name='order_update_lease_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('processed', False), ('search_label', True)), fields=['status', 'label', 'lease_expires_at'], name='order_expedition_lease_idx'),
+        ),
+    ]
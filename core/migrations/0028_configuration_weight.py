@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_order_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='configuration',
+            name='weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Share of the workers given to this configuration'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_configuration_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='stage',
+            field=models.CharField(choices=[('idle', 'Aguardando'), ('order', 'Atualizar pedido'), ('invoice', 'Buscar nota fiscal'), ('invoice_file', 'Baixar XML'), ('integration', 'Enviar pedido'), ('billing', 'Enviar faturamento'), ('expedition', 'Buscar expedição'), ('label', 'Baixar etiqueta'), ('send_label', 'Enviar etiqueta'), ('done', 'Concluído')], default='idle', max_length=20),
+        ),
+    ]
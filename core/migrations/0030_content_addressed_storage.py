@@ -0,0 +1,24 @@
+# Generated by Django 4.0.4 on 2026-10-18 08:48
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0029_order_stage'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='label',
+            field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='xml',
+            field=models.FileField(blank=True, null=True, storage=core.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:03
+
+from django.db import migrations, models
+from django.db.models import Q
+
+from core.migrations._duplicates import remove_duplicated_orders
+
+
+def remove_duplicated_orders_without_numbers(apps, schema_editor):
+    for fields, condition in (
+        (
+            ('configuration', 'number'),
+            Q(number__isnull=False, number_store__isnull=True)
+        ),
+        (
+            ('configuration', 'number_store'),
+            Q(number__isnull=True, number_store__isnull=False)
+        ),
+        (
+            ('configuration',),
+            Q(number__isnull=True, number_store__isnull=True)
+        ),
+    ):
+        remove_duplicated_orders(apps, fields, condition)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0030_content_addressed_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicated_orders_without_numbers,
+            reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('number__isnull', False), ('number_store__isnull', True)), fields=('configuration', 'number'), name='unique_order_number_without_store'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('number__isnull', True), ('number_store__isnull', False)), fields=('configuration', 'number_store'), name='unique_order_store_without_number'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('number__isnull', True), ('number_store__isnull', True)), fields=('configuration',), name='unique_order_without_numbers'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:13
+
+import core.storage
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_order_unique_null_numbers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderLabel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idseq', models.IntegerField()),
+                ('file', models.FileField(storage=core.storage.ContentAddressedStorage(), upload_to='')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='extra_labels', to='core.order')),
+            ],
+            options={
+                'verbose_name': 'Order Label',
+                'verbose_name_plural': 'Order Labels',
+                'ordering': ['idseq'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='orderlabel',
+            constraint=models.UniqueConstraint(fields=('order', 'idseq'), name='unique_order_label_idseq'),
+        ),
+    ]
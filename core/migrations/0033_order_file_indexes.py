@@ -0,0 +1,27 @@
+# Generated by Django 4.0.4 on 2026-10-18 09:15
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_order_label'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='orderlabel',
+            name='file',
+            field=models.FileField(db_index=True, storage=core.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['xml'], name='order_xml_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['label'], name='order_label_idx'),
+        ),
+    ]
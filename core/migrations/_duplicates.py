@@ -0,0 +1,64 @@
+from django.db.models import Count, F, Q
+
+
+def remove_duplicated_orders(apps, fields, condition):
+    """
+    Remove as cópias de um mesmo pedido (mesmos `fields` entre os pedidos
+    de `condition`) antes de criar a constraint única. Fica o pedido já
+    enviado ao integrador ou, se nenhum foi, o mais antigo.
+
+    Cópias com um integrator_id diferente do pedido mantido não são
+    removidas: a migração para sem alterar nada e elas precisam ser
+    resolvidas à mão. Os arquivos das cópias removidas que nenhum pedido
+    restante usa também são apagados.
+    """
+    Order = apps.get_model('core', 'Order')
+    queryset = Order.objects.filter(condition)
+
+    duplicates = queryset.values(*fields).annotate(
+        total=Count('id')
+    ).filter(total__gt=1)
+
+    removals = []
+    conflicts = []
+
+    for duplicate in duplicates:
+        orders = list(
+            queryset.filter(
+                **{field: duplicate[field] for field in fields}
+            ).order_by(
+                F('integrator_id').desc(nulls_last=True),
+                'id'
+            )
+        )
+        kept, copies = orders[0], orders[1:]
+
+        conflicting = [
+            order.id for order in copies
+            if order.integrator_id not in (None, kept.integrator_id)
+        ]
+
+        if conflicting:
+            conflicts.append((kept.id, conflicting))
+        else:
+            removals += copies
+
+    if conflicts:
+        raise RuntimeError(
+            'Duplicated orders sent to the integrator more than once, '
+            'resolve them before migrating (kept, copies): '
+            f'{conflicts}'
+        )
+
+    files = [
+        (file.storage, file.name)
+        for order in removals
+        for file in (order.xml, order.label)
+        if file
+    ]
+
+    Order.objects.filter(id__in=[order.id for order in removals]).delete()
+
+    for storage, name in files:
+        if not Order.objects.filter(Q(xml=name) | Q(label=name)).exists():
+            storage.delete(name)
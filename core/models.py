@@ -1,19 +1,36 @@
 import os
 
 from django.core.files.storage import FileSystemStorage
-from django.db import models
-from django.dispatch import receiver
+from django.db import models, transaction
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from core.fields import CustomCharField
 from core.managers import OrderManager
+from core.storage import ContentAddressedStorage
 from integration_tiny import settings
+from integration_tiny.celery import app
+
+order_status_changed = Signal()
+
+file_storage = ContentAddressedStorage()
+
+
+class LeaseLost(Exception):
+    """
+    O lease do pedido expirou e foi reservado por outro dispatcher; quem
+    tinha o lease antigo deve parar.
+    """
 
 
 class OverwriteStorage(FileSystemStorage):
     """
     Muda o comportamento padrão do Django e o faz sobrescrever arquivos de
     mesmo nome que foram carregados pelo usuário ao invés de renomeá-los.
+
+    Substituído por ContentAddressedStorage; mantido porque as migrações
+    antigas o referenciam.
     """
 
     def get_available_name(self, name, **kwargs):
@@ -48,6 +65,18 @@ class Configuration(models.Model):
     search_labels = models.BooleanField(default=False)
     use_invoice_items = models.BooleanField(default=False)
     is_active = models.BooleanField(default=True)
+    rate_limit = models.PositiveIntegerField(
+        default=30,
+        help_text=_('Requests per minute allowed by the Tiny token')
+    )
+    rate_limit_burst = models.PositiveIntegerField(
+        default=5,
+        help_text=_('Requests that can be sent at once before throttling')
+    )
+    weight = models.PositiveSmallIntegerField(
+        default=1,
+        help_text=_('Share of the workers given to this configuration')
+    )
 
     def __str__(self):
         return f'Configuration {self.name}'
@@ -110,6 +139,37 @@ class Order(models.Model):
         (CANCELLED, 'Cancelado'),
     )
 
+    STAGE_IDLE = 'idle'
+    STAGE_ORDER = 'order'
+    STAGE_INVOICE = 'invoice'
+    STAGE_INVOICE_FILE = 'invoice_file'
+    STAGE_INTEGRATION = 'integration'
+    STAGE_BILLING = 'billing'
+    STAGE_EXPEDITION = 'expedition'
+    STAGE_LABEL = 'label'
+    STAGE_SEND_LABEL = 'send_label'
+    STAGE_DONE = 'done'
+
+    STAGES = (
+        (STAGE_IDLE, 'Aguardando'),
+        (STAGE_ORDER, 'Atualizar pedido'),
+        (STAGE_INVOICE, 'Buscar nota fiscal'),
+        (STAGE_INVOICE_FILE, 'Baixar XML'),
+        (STAGE_INTEGRATION, 'Enviar pedido'),
+        (STAGE_BILLING, 'Enviar faturamento'),
+        (STAGE_EXPEDITION, 'Buscar expedição'),
+        (STAGE_LABEL, 'Baixar etiqueta'),
+        (STAGE_SEND_LABEL, 'Enviar etiqueta'),
+        (STAGE_DONE, 'Concluído'),
+    )
+
+    TERMINAL_STAGES = (STAGE_IDLE, STAGE_DONE)
+
+    # Gravadas só por OrderManager.claim e set_stage, com update
+    # condicional. Um save() comum não pode devolver um lease que outro
+    # dispatcher já reservou.
+    LEASE_FIELDS = ('stage', 'lease_owner', 'lease_expires_at')
+
     identifier = models.IntegerField()
     number = models.IntegerField(null=True, blank=True)
     number_store = models.CharField(max_length=100, null=True, blank=True)
@@ -129,12 +189,12 @@ class Order(models.Model):
     xml = models.FileField(
         null=True,
         blank=True,
-        storage=OverwriteStorage()
+        storage=file_storage
     )
     label = models.FileField(
         null=True,
         blank=True,
-        storage=OverwriteStorage()
+        storage=file_storage
     )
     configuration = models.ForeignKey(Configuration, on_delete=models.PROTECT)
     integrator_id = models.IntegerField(null=True, blank=True)
@@ -151,9 +211,21 @@ class Order(models.Model):
         default=0
     )
     search_label = models.BooleanField(default=False)
-    running = models.BooleanField(default=False)
+    stage = models.CharField(
+        max_length=20,
+        choices=STAGES,
+        default=STAGE_IDLE
+    )
+    lease_owner = models.CharField(max_length=100, null=True, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
     processed = models.BooleanField(default=False)
     sent_label = models.BooleanField(default=False)
+    order_fingerprint = models.CharField(max_length=64, null=True, blank=True)
+    invoice_fingerprint = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -162,12 +234,78 @@ class Order(models.Model):
     class Meta:
         verbose_name = _('Order')
         verbose_name_plural = _('Orders')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['configuration', 'number', 'number_store'],
+                name='unique_order_number_by_configuration'
+            ),
+            # NULL nunca é igual a NULL, então os pedidos sem número ou sem
+            # número da loja precisam das próprias constraints.
+            models.UniqueConstraint(
+                fields=['configuration', 'number'],
+                condition=models.Q(
+                    number__isnull=False,
+                    number_store__isnull=True
+                ),
+                name='unique_order_number_without_store'
+            ),
+            models.UniqueConstraint(
+                fields=['configuration', 'number_store'],
+                condition=models.Q(
+                    number__isnull=True,
+                    number_store__isnull=False
+                ),
+                name='unique_order_store_without_number'
+            ),
+            models.UniqueConstraint(
+                fields=['configuration'],
+                condition=models.Q(
+                    number__isnull=True,
+                    number_store__isnull=True
+                ),
+                name='unique_order_without_numbers'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['status', 'lease_expires_at'],
+                name='order_status_lease_idx'
+            ),
+            models.Index(
+                fields=['status', 'xml', 'lease_expires_at'],
+                name='order_update_lease_idx',
+                condition=models.Q(processed=False)
+            ),
+            models.Index(
+                fields=['status', 'label', 'lease_expires_at'],
+                name='order_expedition_lease_idx',
+                condition=models.Q(search_label=True, processed=False)
+            ),
+            models.Index(
+                fields=['status', 'label'],
+                name='order_pending_label_idx',
+                condition=models.Q(
+                    search_label=True,
+                    sent_label=False,
+                    processed=False
+                )
+            ),
+            # Referências a um arquivo, consultadas antes de removê-lo.
+            models.Index(fields=['xml'], name='order_xml_idx'),
+            models.Index(fields=['label'], name='order_label_idx'),
+        ]
 
     def save(
         self, force_insert=False, force_update=False, using=None, update_fields=None
     ):
         self.search_label = self.configuration.search_labels
 
+        if update_fields is None and not self._state.adding:
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LEASE_FIELDS
+            ]
+
         super(Order, self).save(
             force_insert,
             force_update,
@@ -182,8 +320,12 @@ class Order(models.Model):
         )
 
     def update_status(self, status, save=True):
+        changed = self.status != status
         self.status = status
 
+        if changed:
+            order_status_changed.send(sender=Order, instance=self)
+
         if not save:
             return
 
@@ -191,9 +333,66 @@ class Order(models.Model):
             update_fields=['status']
         )
 
-    def set_running(self, running=True):
-        self.running = running
-        self.save(update_fields=['running'])
+    def update_lease(self, **fields):
+        """
+        Grava os campos do lease só se ele ainda for o que este objeto
+        leu; caso contrário levanta LeaseLost sem alterar nada.
+        """
+        updated = Order.objects.filter(
+            id=self.id,
+            lease_owner=self.lease_owner,
+            lease_expires_at=self.lease_expires_at
+        ).update(**fields)
+
+        if not updated:
+            raise LeaseLost(f'Lease of order {self} taken by another worker')
+
+        for field, value in fields.items():
+            setattr(self, field, value)
+
+    def check_lease(self, owner):
+        """
+        Garante que o pedido ainda está na reserva `owner` que enfileirou
+        a task; sem `owner` (tasks disparadas pelo admin) não há o que
+        verificar.
+        """
+        if owner and self.lease_owner != owner:
+            raise LeaseLost(f'Lease of order {self} taken by another worker')
+
+    def set_stage(self, stage, owner=None):
+        """
+        Move o pedido para a etapa. Enquanto houver etapa pendente o lease
+        é renovado, para que os dispatchers não peguem o pedido de novo;
+        nas etapas finais ele é liberado.
+        """
+        if stage in self.TERMINAL_STAGES:
+            self.update_lease(
+                stage=stage,
+                lease_owner=None,
+                lease_expires_at=None
+            )
+            return
+
+        self.update_lease(
+            stage=stage,
+            lease_owner=self.lease_owner or owner,
+            lease_expires_at=timezone.now() + timezone.timedelta(
+                seconds=settings.ORDER_LEASE_SECONDS
+            )
+        )
+
+    def save_file(self, field, name, content):
+        """
+        Grava o arquivo no campo e remove o anterior se nenhum outro pedido
+        usar o mesmo conteúdo.
+        """
+        file = getattr(self, field)
+        previous = file.name
+
+        file.save(name, content)
+
+        if previous and previous != file.name:
+            delete_file(previous)
 
     def set_processed(self, processed=True):
         self.processed = processed
@@ -227,14 +426,81 @@ class OrderItems(models.Model):
         return f"{self.order} - {self.product}"
 
 
-def delete_file(file):
-    if not file:
+class OrderLabel(models.Model):
+    """
+    Partes da etiqueta além de `Order.label`, como os demais PDFs de um
+    pedido com vários volumes. São enviadas ao integrador junto com ela.
+    """
+    order = models.ForeignKey(
+        Order,
+        related_name='extra_labels',
+        on_delete=models.CASCADE
+    )
+    idseq = models.IntegerField()
+    file = models.FileField(storage=file_storage, db_index=True)
+
+    class Meta:
+        verbose_name = _('Order Label')
+        verbose_name_plural = _('Order Labels')
+        ordering = ['idseq']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['order', 'idseq'],
+                name='unique_order_label_idseq'
+            ),
+        ]
+
+    @property
+    def filename(self):
+        _, extension = os.path.splitext(self.file.name)
+
+        return f'{self.order.number}-{self.idseq}{extension}'
+
+    def __str__(self):
+        return f'{self.order} - {self.idseq}'
+
+
+def is_file_used(name):
+    # Com o storage por conteúdo o mesmo arquivo pode ser de mais de um
+    # pedido.
+    return Order.objects.filter(
+        models.Q(xml=name) | models.Q(label=name)
+    ).exists() or OrderLabel.objects.filter(file=name).exists()
+
+
+def delete_file(name):
+    """
+    Agenda a remoção de um arquivo que nenhum pedido usa mais. Ela só
+    acontece depois de FILE_DELETE_GRACE_SECONDS, para não apagar um
+    arquivo que outro pedido acabou de reaproveitar e ainda não salvou.
+    """
+    if not name or is_file_used(name):
         return
-    if os.path.isfile(file.path):
-        os.remove(file.path)
+
+    signature = app.signature(
+        'core.tasks.task_delete_file',
+        args=(name,),
+        countdown=settings.FILE_DELETE_GRACE_SECONDS
+    )
+    transaction.on_commit(signature.apply_async)
+
+
+def delete_unused_file(name) -> bool:
+    if is_file_used(name):
+        return False
+
+    return file_storage.delete_stale(
+        name,
+        settings.FILE_DELETE_GRACE_SECONDS
+    )
 
 
 @receiver(models.signals.post_delete, sender=Order)
 def auto_delete_file_on_delete(sender, instance: Order, **kwargs):
-    delete_file(instance.xml)
-    delete_file(instance.label)
+    delete_file(instance.xml.name)
+    delete_file(instance.label.name)
+
+
+@receiver(models.signals.post_delete, sender=OrderLabel)
+def auto_delete_label_on_delete(sender, instance: OrderLabel, **kwargs):
+    delete_file(instance.file.name)
@@ -0,0 +1,59 @@
+from collections import defaultdict, deque
+from typing import Dict, Hashable, Iterable, Iterator, List
+
+from core.models import Order
+
+
+class FairScheduler:
+    """
+    Deficit round robin entre filas, uma por configuração. A cada rodada
+    cada fila recebe `quantum * peso` créditos e entrega um item por
+    crédito, então um cliente com milhares de pedidos não atrasa um
+    cliente com poucos.
+    """
+
+    def __init__(self, weights: Dict[Hashable, int] = None, quantum=1):
+        self.weights = weights or {}
+        self.quantum = quantum
+
+    def weight(self, key):
+        return max(self.weights.get(key) or 1, 1)
+
+    def interleave(self, queues: Dict[Hashable, Iterable]) -> Iterator:
+        queues = {
+            key: deque(items)
+            for key, items in queues.items()
+        }
+        deficits = defaultdict(int)
+
+        while queues:
+            for key in list(queues):
+                queue = queues[key]
+                deficits[key] += self.quantum * self.weight(key)
+
+                while queue and deficits[key] >= 1:
+                    yield queue.popleft()
+                    deficits[key] -= 1
+
+                if not queue:
+                    del queues[key]
+
+
+def fair_order_ids(ids: List[int]) -> List[int]:
+    queues = defaultdict(list)
+    weights = {}
+
+    rows = Order.objects.filter(
+        id__in=ids
+    ).values_list(
+        'id', 'configuration_id', 'configuration__weight'
+    ).order_by('id')
+
+    for _id, configuration_id, weight in rows:
+        queues[configuration_id].append(_id)
+        weights[configuration_id] = weight
+
+    return list(
+        FairScheduler(weights).interleave(queues)
+    )
+
@@ -0,0 +1,120 @@
+import fcntl
+import hashlib
+import os
+import time
+from contextlib import contextmanager
+from tempfile import mkstemp
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Grava cada arquivo com o nome do hash do conteúdo, distribuído em
+    subdiretórios pelos primeiros caracteres do hash
+    (`ab/cd/abcd....xml`). Conteúdo igual resulta no mesmo arquivo, então
+    regravar um XML que não mudou não escreve nada no destino.
+
+    O conteúdo é escrito em um arquivo temporário no mesmo volume e só
+    então movido para o destino, para que ninguém leia um arquivo pela
+    metade. Arquivos gravados com os nomes antigos continuam acessíveis.
+
+    Como o mesmo arquivo pode ser de vários pedidos, regravar um conteúdo
+    existente atualiza a data de modificação dele, sob o mesmo lock usado
+    por delete_stale: um arquivo reaproveitado há pouco não é removido
+    antes que o pedido que o reaproveitou seja salvo.
+    """
+    TEMPORARY_DIRECTORY = '.incoming'
+    LOCK_DIRECTORY = '.locks'
+    SHARD_DEPTH = 2
+    SHARD_WIDTH = 2
+
+    @contextmanager
+    def lock(self, name):
+        # Um lock por prefixo do nome, para não criar um arquivo de lock
+        # por arquivo gravado.
+        directory = os.path.join(self.location, self.LOCK_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+
+        stripe = hashlib.sha1(name.encode()).hexdigest()[:self.SHARD_WIDTH]
+
+        with open(os.path.join(directory, stripe), 'a') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def delete_stale(self, name, grace_seconds) -> bool:
+        """
+        Remove o arquivo só se ele não foi gravado nem reaproveitado nos
+        últimos `grace_seconds`.
+        """
+        with self.lock(name):
+            try:
+                modified = os.path.getmtime(self.path(name))
+            except FileNotFoundError:
+                return False
+
+            if time.time() - modified < grace_seconds:
+                return False
+
+            self.delete(name)
+
+        return True
+
+    def get_available_name(self, name, max_length=None):
+        # O nome final depende do conteúdo e é decidido em _save.
+        return name
+
+    def hashed_name(self, digest, name):
+        _, extension = os.path.splitext(name)
+        shards = [
+            digest[index * self.SHARD_WIDTH:(index + 1) * self.SHARD_WIDTH]
+            for index in range(self.SHARD_DEPTH)
+        ]
+
+        return '/'.join(shards + [f'{digest}{extension.lower()}'])
+
+    def _save(self, name, content):
+        directory = os.path.join(self.location, self.TEMPORARY_DIRECTORY)
+        os.makedirs(directory, exist_ok=True)
+
+        descriptor, temporary = mkstemp(dir=directory)
+        digest = hashlib.sha256()
+
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+
+                    digest.update(chunk)
+                    file.write(chunk)
+
+                file.flush()
+                os.fsync(file.fileno())
+
+            name = self.hashed_name(digest.hexdigest(), name)
+            path = self.path(name)
+
+            with self.lock(name):
+                if os.path.exists(path):
+                    os.remove(temporary)
+                    os.utime(path)
+                    return name
+
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                # mkstemp cria o arquivo só para o dono.
+                os.chmod(temporary, self.file_permissions_mode or 0o644)
+
+                os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+
+        return name
@@ -1,10 +1,23 @@
-from celery.signals import beat_init
+from functools import partial
+
 from django.db import transaction
 
+from core.integration.engine import (SearchExpeditionsEngine,
+                                     UpdateOrdersEngine)
 from core.integration.operations import *
-from core.models import Configuration
-from core.models import Order
+from core.integration.pipeline import (RETRYABLE_ERRORS, StageMetrics,
+                                       enqueue_many, fail_stage, get_metrics,
+                                       retry_delay, run_batch_stage,
+                                       run_stage)
+from core.managers import claim_owner
+from core.models import Configuration, LeaseLost
+from core.models import Order, delete_unused_file
+from core.scheduler import fair_order_ids
 from integration_tiny.celery import app
+from integration_tiny.settings import (DISPATCH_CHUNK_SIZE,
+                                       DISPATCH_MAX_CHUNKS,
+                                       PIPELINE_RETRY_ATTEMPTS,
+                                       SYNC_ORDERS_RETRY_DELAY)
 
 
 @app.task(rate_limit='10/m')
@@ -29,91 +42,139 @@ def task_send_cancelation_to_integrador(order_id):
     ).execute()
 
 
-@app.task(rate_limit='1/s')
-def task_send_order_to_integrador(order_id):
-    order = Order.objects.get(
-        id=order_id
-    )
+def run_stage_task(task, order_id, stage, owner=None):
+    try:
+        order = Order.objects.select_related(
+            'configuration'
+        ).get(id=order_id)
+    except Order.DoesNotExist:
+        return
 
-    SendRequestToIntegrator(
-        order,
-    ).execute()
+    try:
+        run_stage(order, stage, owner)
+    except LeaseLost as error:
+        logger.info(f'[Order {order}] - Stage {stage}: {error}')
+    except RETRYABLE_ERRORS as error:
+        if task.request.retries >= task.max_retries:
+            fail_stage(order, stage, error)
+            return
+
+        get_metrics().record(stage, StageMetrics.RETRIED)
+
+        raise task.retry(
+            exc=error,
+            countdown=retry_delay(task.request.retries)
+        )
+    except OperationError as error:
+        fail_stage(order, stage, error)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_update_order(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_ORDER, owner)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_save_invoice(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_INVOICE, owner)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_save_invoice_file(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_INVOICE_FILE, owner)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS, rate_limit='1/s')
+def task_send_order_to_integrador(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_INTEGRATION, owner)
 
 
 @app.task(rate_limit='1/s')
-def task_update_order(order_id):
-    try:
-        order = Order.objects.get(
-            id=order_id
-        )
-        try:
-            UpdateOrder(
-                order.configuration,
-                order
-            ).execute()
-        except OperationError as error:
-            logger.warning(
-                f'[Order {order}] - Save labels: {error}'
-            )
-        finally:
-            order.set_running(False)
+def task_send_batch_to_integrador(stage, order_ids, owner=None):
+    run_batch_stage(order_ids, stage, owner)
 
-    except Order.DoesNotExist:
-        pass
 
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_send_billing_to_integrador(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_BILLING, owner)
 
-@app.task(rate_limit='10/m')
-def task_update_orders():
-    orders = Order.objects.search_update_orders()
-    ids = list(
-        orders.values_list('id', flat=True)
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_search_expedition(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_EXPEDITION, owner)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_save_label(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_LABEL, owner)
+
+
+@app.task(bind=True, max_retries=PIPELINE_RETRY_ATTEMPTS)
+def task_send_label_to_integrador(self, order_id, owner=None):
+    run_stage_task(self, order_id, Order.STAGE_SEND_LABEL, owner)
+
+
+@app.task
+def task_delete_file(name):
+    if delete_unused_file(name):
+        logger.info(f'File {name} deleted')
+
+
+@app.task
+def task_update_orders_batch(order_ids, owner=None):
+    UpdateOrdersEngine(
+        order_ids,
+        owner=owner
+    ).execute()
+
+
+def claim(queryset, owner):
+    """
+    Reserva só o que os workers conseguem processar antes do lease
+    expirar; o restante fica para as próximas execuções do beat.
+    """
+    return Order.objects.claim_per_configuration(
+        queryset,
+        limit=DISPATCH_CHUNK_SIZE * DISPATCH_MAX_CHUNKS,
+        owner=owner
     )
-    orders.update(running=True)
 
-    for _id in ids:
+
+def dispatch_in_chunks(task, ids, owner, chunk_size=DISPATCH_CHUNK_SIZE):
+    for start in range(0, len(ids), chunk_size):
         transaction.on_commit(
-            lambda: task_update_order.delay(
-                _id
-            )
+            partial(task.delay, ids[start:start + chunk_size], owner)
         )
 
 
 @app.task(rate_limit='10/m')
-def task_search_expedition(order_id):
-    try:
-        order = Order.objects.get(
-            id=order_id
-        )
-        try:
-            SaveExpeditionInfo(
-                order.configuration,
-                order
-            ).execute()
-        except OperationError as error:
-            logger.warning(
-                f'[Order {order}] - Save labels: {error}'
-            )
+def task_update_orders():
+    owner = claim_owner()
+    ids = claim(Order.objects.search_update_orders(), owner)
+    Order.objects.filter(id__in=ids).update(stage=Order.STAGE_ORDER)
 
-        finally:
-            order.set_running(False)
-    except Order.DoesNotExist:
-        pass
+    dispatch_in_chunks(task_update_orders_batch, fair_order_ids(ids), owner)
+
+
+@app.task
+def task_search_expeditions_batch(order_ids, owner=None):
+    SearchExpeditionsEngine(
+        order_ids,
+        owner=owner
+    ).execute()
 
 
 @app.task
 def task_search_expeditions():
-    orders = Order.objects.search_expedition()
-    ids = list(
-        orders.values_list('id', flat=True)
+    owner = claim_owner()
+    ids = claim(Order.objects.search_expedition(), owner)
+    Order.objects.filter(id__in=ids).update(stage=Order.STAGE_EXPEDITION)
+
+    dispatch_in_chunks(
+        task_search_expeditions_batch,
+        fair_order_ids(ids),
+        owner
     )
-    orders.update(running=True)
-
-    for _id in ids:
-        transaction.on_commit(
-            lambda: task_search_expedition.delay(
-                _id
-            )
-        )
 
 
 @app.task
@@ -165,14 +226,29 @@ def task_sync_orders(configuration_id):
     queryset = Configuration.objects.filter(
         is_active=True
     ).all()
-    if configuration_id > 0:
-        queryset = queryset.filter(
-            id=configuration_id
-        )
+
+    if configuration_id <= 0:
+        # Uma task por configuração, para que a sincronização de um cliente
+        # grande não atrase a dos demais.
+        for _id in queryset.order_by('-weight').values_list('id', flat=True):
+            task_sync_orders.delay(_id)
+
+        return
+
+    queryset = queryset.filter(
+        id=configuration_id
+    )
 
     for configuration in queryset:
         try:
-            SaveOrders(configuration).execute()
+            operation = SaveOrders(configuration)
+            operation.execute()
+
+            if operation.failed_pages:
+                task_sync_order_pages.apply_async(
+                    (configuration.id, operation.failed_pages),
+                    countdown=SYNC_ORDERS_RETRY_DELAY
+                )
 
             task_update_orders.delay()
 
@@ -183,30 +259,36 @@ def task_sync_orders(configuration_id):
 
 
 @app.task
-def task_send_labels():
-    queryset = Order.objects.pending_send_labels()
+def task_sync_order_pages(configuration_id, pages):
+    configuration = Configuration.objects.get(
+        id=configuration_id
+    )
 
-    for order in queryset:
-        SendRequestLabelToIntegrator(
-            order
+    try:
+        SaveOrders(
+            configuration,
+            pages=pages
         ).execute()
 
+        task_update_orders.delay()
+
+    except OperationError as error:
+        logger.warning(
+            f'[{configuration}] - Sync orders in paginations {pages}: {error}'
+        )
+
 
 @app.task
-def task_send_orders_awaiting_integration():
-    queryset = Order.objects.filter(
-        status=Order.AWAITING_INTEGRATION,
-        running=False
-    )
+def task_send_labels():
+    owner = claim_owner()
+    ids = claim(Order.objects.pending_send_labels(), owner)
+
+    enqueue_many(fair_order_ids(ids), Order.STAGE_SEND_LABEL, owner)
 
-    for order in queryset:
-        SendRequestToIntegrator(
-            order
-        ).execute()
 
+@app.task
+def task_send_orders_awaiting_integration():
+    owner = claim_owner()
+    ids = claim(Order.objects.search_awaiting_integration(), owner)
 
-@beat_init.connect
-def task_callback_start_beat(**kwargs):
-    Order.objects.filter(
-        running=True
-    ).update(running=False)
+    enqueue_many(fair_order_ids(ids), Order.STAGE_INTEGRATION, owner)
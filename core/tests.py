@@ -1,3 +1,1164 @@
-from django.test import TestCase
+import io
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.admin import AdminSite
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from requests import Response
+
+from core.admin import OrderAdmin
+from core.integration.client import IntegratorClient
+from core.integration.deadline import Deadline, current_deadline
+from core.integration.engine import UpdateOrdersEngine
+from core.integration.entities import (CustomerData, InvoiceData, OrderData,
+                                       OrderExpeditionInfo, OrderItemData,
+                                       OrderResumeData)
+from core.integration.exceptions import (CircuitOpenError, OperationError,
+                                         ThrottledError, TransientError)
+from core.integration.operations import (SaveExpeditionInfo, SaveInvoice,
+                                         SaveInvoiceFile, SaveOrders,
+                                         SendBillingBatchToIntegrator,
+                                         SendCancelationBatchToIntegrator,
+                                         SendLabelsBatchToIntegrator,
+                                         SendOrdersBatchToIntegrator,
+                                         SendRequestLabelToIntegrator,
+                                         UpdateOrder,
+                                         invalidate_order_cache)
+from core.integration.resilience import CircuitBreaker, RetryPolicy
+from core.management.commands.integrator_standin import StandInIntegrator
+from core.models import (Configuration, Customer, LeaseLost, Order,
+                         OrderLabel, delete_unused_file, file_storage)
+from core.tasks import task_send_order_to_integrador
+from integration_tiny import settings
+from utils import normalize
+from utils.formatts import Formatattr
+
+FULL_SCAN_PATTERNS = {
+    'sqlite': re.compile(r'SCAN core_order\b'),
+    'postgresql': re.compile(r'Seq Scan on core_order\b'),
+}
+
+
+@skipUnless(
+    connection.vendor in FULL_SCAN_PATTERNS,
+    'Query plan check not available for this database'
+)
+class OrderManagerQueryPlanTestCase(TestCase):
+    # Consulta do manager e o índice que ela deve usar.
+    QUERIES = {
+        'search_update_orders': 'order_update_lease_idx',
+        'search_expedition': 'order_expedition_lease_idx',
+        'pending_send_labels': 'order_pending_label_idx',
+        'search_awaiting_integration': 'order_status_lease_idx',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        configuration = Configuration.objects.create(
+            name='plan',
+            token='tiny',
+            token_integrator='integrator',
+            search_labels=True
+        )
+
+        # A maior parte dos pedidos já foi processada, como em produção;
+        # sem estatísticas o planner não tem como escolher entre índices.
+        Order.objects.bulk_create([
+            Order(
+                identifier=index,
+                number=index,
+                configuration=configuration,
+                search_label=True,
+                **cls.order_state(index % 10, index)
+            )
+            for index in range(5000)
+        ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    @staticmethod
+    def order_state(kind, index):
+        # Nomes únicos, como os do storage por conteúdo.
+        xml = f'{index}.xml'
+        label = f'{index}.zpl'
+
+        if kind == 0:
+            return dict(status=Order.AWAITING_FILES)
+        if kind == 1:
+            return dict(status=Order.AWAITING_INTEGRATION, xml=xml)
+        if kind == 2:
+            return dict(status=Order.IMPORTED, xml=xml)
+        if kind == 3:
+            return dict(status=Order.IMPORTED, xml=xml, label=label)
+
+        return dict(
+            status=Order.IMPORTED,
+            xml=xml,
+            label=label,
+            sent_label=True,
+            processed=kind > 5
+        )
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def test_queries_use_their_indexes(self):
+        pattern = FULL_SCAN_PATTERNS[connection.vendor]
+
+        for name, index in self.QUERIES.items():
+            with self.subTest(query=name):
+                plan = getattr(Order.objects, name)().explain()
+
+                self.assertIsNone(
+                    pattern.search(plan),
+                    f'{name} falls back to a full scan:\n{plan}'
+                )
+                self.assertIn(
+                    index,
+                    plan,
+                    f'{name} does not use {index}:\n{plan}'
+                )
+
+    def test_file_references_use_indexes(self):
+        plan = Order.objects.filter(
+            Q(xml='1.xml') | Q(label='3.zpl')
+        ).explain()
+
+        self.assertIsNone(FULL_SCAN_PATTERNS[connection.vendor].search(plan))
+        self.assertIn('order_xml_idx', plan)
+        self.assertIn('order_label_idx', plan)
+
+
+class OrderLeaseTestCase(TestCase):
+    def setUp(self):
+        configuration = Configuration.objects.create(
+            name='lease',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        order = Order.objects.create(
+            identifier=1,
+            number=1,
+            configuration=configuration,
+            status=Order.AWAITING_INTEGRATION
+        )
+
+        Order.objects.claim(Order.objects.filter(id=order.id), owner='first')
+        self.order = Order.objects.get(id=order.id)
+
+        # O lease do primeiro expira e outro dispatcher reserva o pedido.
+        Order.objects.filter(id=order.id).update(
+            lease_expires_at=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        Order.objects.claim(Order.objects.filter(id=order.id), owner='second')
+
+    def test_expired_lease_is_not_taken_back(self):
+        with self.assertRaises(LeaseLost):
+            self.order.set_stage(Order.STAGE_INTEGRATION)
+
+        with self.assertRaises(LeaseLost):
+            self.order.set_stage(Order.STAGE_IDLE)
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual(order.lease_owner, 'second')
+        self.assertGreater(order.lease_expires_at, timezone.now())
+
+    def test_save_does_not_write_lease(self):
+        self.order.observation = 'changed'
+        self.order.save()
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual(order.observation, 'changed')
+        self.assertEqual(order.lease_owner, 'second')
+
+
+class OrderClaimTestCase(TestCase):
+    def setUp(self):
+        for name in ('first', 'second'):
+            configuration = Configuration.objects.create(
+                name=name,
+                token='tiny',
+                token_integrator='integrator'
+            )
+            Order.objects.bulk_create([
+                Order(
+                    identifier=number,
+                    number=number,
+                    configuration=configuration,
+                    status=Order.AWAITING_INTEGRATION
+                )
+                for number in range(1, 6)
+            ])
+
+    def test_claim_is_bounded_per_configuration(self):
+        queryset = Order.objects.search_awaiting_integration()
+
+        ids = Order.objects.claim_per_configuration(queryset, 3, 'first')
+
+        claimed = Order.objects.filter(id__in=ids)
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(
+            sorted(claimed.values_list('configuration__name', flat=True)),
+            ['first'] * 3 + ['second'] * 3
+        )
+
+        ids = Order.objects.claim_per_configuration(queryset, 3, 'second')
+
+        self.assertEqual(len(ids), 4)
+        self.assertFalse(
+            Order.objects.filter(lease_owner__isnull=True).exists()
+        )
+
+    def test_admin_action_skips_leased_orders(self):
+        queryset = Order.objects.filter(configuration__name='first')
+        leased = Order.objects.claim(queryset, 2, 'dispatcher')
+
+        admin = OrderAdmin(Order, AdminSite())
+
+        with mock.patch.object(
+            task_send_order_to_integrador, 'delay'
+        ) as delay, mock.patch.object(admin, 'message_user'):
+            admin.handle_send_order_to_integrator(None, queryset)
+
+        sent = {order_id for (order_id, _), _ in delay.call_args_list}
+        owners = {owner for (_, owner), _ in delay.call_args_list}
+
+        self.assertEqual(len(sent), 3)
+        self.assertFalse(sent & set(leased))
+        self.assertEqual(len(owners), 1)
+        self.assertEqual(
+            set(Order.objects.filter(id__in=sent).values_list(
+                'lease_owner', flat=True
+            )),
+            owners
+        )
+
+
+class OrdersEngineTestCase(TestCase):
+    def setUp(self):
+        configuration = Configuration.objects.create(
+            name='engine',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        order = Order.objects.create(
+            identifier=1,
+            number=1,
+            configuration=configuration
+        )
+        Order.objects.claim(Order.objects.filter(id=order.id), owner='engine')
+        Order.objects.filter(id=order.id).update(stage=Order.STAGE_ORDER)
+
+        self.order = order
+        self.app = mock.Mock()
+
+        for patcher in (
+            mock.patch('core.integration.engine.connections'),
+            mock.patch('core.integration.pipeline.app', self.app),
+            mock.patch('core.integration.pipeline.get_metrics'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def process(self, error):
+        with mock.patch(
+            'core.integration.pipeline.UpdateOrder.execute',
+            side_effect=error
+        ):
+            with self.captureOnCommitCallbacks(execute=True):
+                UpdateOrdersEngine([self.order.id], owner='engine').process(
+                    self.order.id
+                )
+
+        return Order.objects.get(id=self.order.id)
+
+    def test_retryable_error_goes_back_to_stage_task(self):
+        order = self.process(ThrottledError('API bloqueada'))
+
+        self.app.signature.assert_called_once_with(
+            'core.tasks.task_update_order',
+            args=(order.id, 'engine'),
+            countdown=mock.ANY
+        )
+        self.assertEqual(order.stage, Order.STAGE_ORDER)
+        self.assertEqual(order.lease_owner, 'engine')
+
+    def test_unexpected_error_releases_order(self):
+        with self.assertLogs('core', level='ERROR'):
+            order = self.process(ValueError('Expecting value'))
+
+        self.app.signature.assert_not_called()
+        self.assertEqual(order.stage, Order.STAGE_IDLE)
+        self.assertIsNone(order.lease_owner)
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def open_breaker(self):
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        breaker.opened_at -= 60
+
+        return breaker
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = self.open_breaker()
+
+        breaker.before_call()
+
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+
+        breaker.record_success()
+        breaker.before_call()
+
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_half_open_trial_expires(self):
+        breaker = self.open_breaker()
+
+        breaker.before_call()
+        breaker.trial_started_at -= 60
+        breaker.before_call()
+
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+    def test_server_error_on_last_attempt_is_transient(self):
+        response = Response()
+        response.status_code = 503
+        response.raw = io.BytesIO(b'')
+
+        client = IntegratorClient(Configuration(token_integrator='t'))
+        client.retry_policy = RetryPolicy(attempts=2, backoff=0)
+
+        with mock.patch.object(
+            CircuitBreaker, 'record_failure'
+        ) as record_failure, mock.patch(
+            'core.integration.client.get_redis'
+        ), mock.patch.object(
+            type(client.session), 'request', return_value=response
+        ) as request:
+            with self.assertRaises(TransientError):
+                client.get('orders')
+
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(record_failure.call_count, 2)
+
+
+class OrderCacheKeyTestCase(TestCase):
+    def test_invalidation_deletes_operations_keys(self):
+        configuration = Configuration.objects.create(
+            name='cache',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        order = Order.objects.create(
+            identifier=1,
+            number=1,
+            invoice_id=2,
+            configuration=configuration
+        )
+        keys = [
+            operation(configuration, order).cache_key
+            for operation in (UpdateOrder, SaveInvoice, SaveExpeditionInfo)
+        ]
+
+        with mock.patch(
+            'core.integration.operations.get_response_cache'
+        ) as get_response_cache:
+            invalidate_order_cache(Order, order)
+
+        get_response_cache().delete.assert_called_once_with(*keys)
+
+
+class SaveOrdersTestCase(TestCase):
+    def setUp(self):
+        self.configuration = Configuration.objects.create(
+            name='sync',
+            token='tiny',
+            token_integrator='integrator'
+        )
+
+    def test_failed_pages_keep_the_sync_going(self):
+        deadlines = {}
+
+        def fetch_page(page):
+            deadlines[page] = current_deadline()
+
+            if page == 3:
+                raise ValueError('unexpected payload')
+
+            return mock.Mock(page=page, pages=4)
+
+        operation = SaveOrders(self.configuration)
+
+        with Deadline() as deadline, mock.patch.object(
+            operation, 'fetch_page', side_effect=fetch_page
+        ), mock.patch.object(operation, 'save') as save:
+            operation.fetch_pages([2, 3, 4])
+
+        self.assertEqual(operation.failed_pages, [3])
+        self.assertCountEqual(
+            [call.args[0].page for call in save.call_args_list], [2, 4]
+        )
+        self.assertEqual(set(deadlines.values()), {deadline})
+
+
+class SaveInvoiceFileTestCase(TestCase):
+    def setUp(self):
+        configuration = Configuration.objects.create(
+            name='invoice',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        order = Order.objects.create(
+            identifier=1,
+            number=1,
+            configuration=configuration,
+            invoice_id=10
+        )
+
+        patcher = mock.patch('core.integration.operations.TinyClient')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.operation = SaveInvoiceFile(configuration, order)
+
+    def response(self, content):
+        response = Response()
+        response.status_code = 200
+        response.headers['Content-Type'] = 'text/xml'
+        response.raw = io.BytesIO(content)
+
+        return response
+
+    def test_xml_error_is_classified(self):
+        self.operation.client.get.return_value = self.response(
+            b'<?xml version="1.0" encoding="UTF-8"?><retorno>'
+            b'<status>Erro</status><codigo_erro>6</codigo_erro>'
+            b'<erros><erro>API Bloqueada - Excedido o numero de acessos '
+            b'a API</erro></erros></retorno>'
+        )
+
+        with self.assertRaises(ThrottledError):
+            self.operation.execute()
+
+        self.operation.client.limiter.throttled.assert_called_once()
+
+    def test_response_without_invoice(self):
+        self.operation.client.get.return_value = self.response(
+            b'<retorno><status>OK</status></retorno>'
+        )
+
+        with self.assertRaisesMessage(OperationError, 'Invoice XML'):
+            self.operation.execute()
+
+
+class StandInMixin:
+    """
+    Sobe o integrador em memória e aponta o IntegratorClient para ele.
+    """
+
+    def serve(self, **kwargs):
+        server = StandInIntegrator(('127.0.0.1', 0), **kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        self.redis = mock.Mock()
+        self.redis.exists.return_value = 0
+
+        for patcher in (
+            mock.patch.object(IntegratorClient, 'BASE_URL', server.url),
+            mock.patch(
+                'core.integration.operations.get_redis',
+                return_value=self.redis
+            ),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        return server
+
+    def use_media_root(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+
+        settings = self.settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class SendOrdersBatchToIntegratorTestCase(StandInMixin, TestCase):
+    def setUp(self):
+        configuration = Configuration.objects.create(
+            name='batch',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        customer = Customer.objects.create(cnpj_cpf='1', postal_code='2')
+
+        self.orders = [
+            Order.objects.create(
+                identifier=number,
+                number=number,
+                configuration=configuration,
+                customer=customer,
+                status=Order.AWAITING_INTEGRATION
+            )
+            for number in range(1, 7)
+        ]
+        self.configuration = configuration
+
+    def execute(self):
+        return SendOrdersBatchToIntegrator(
+            self.configuration,
+            self.orders
+        ).execute()
+
+    def test_partial_success_is_mapped_to_orders(self):
+        server = self.serve(fail_every=3)
+
+        pending = self.execute()
+
+        self.assertEqual(
+            [order.number for order in pending],
+            [3, 6]
+        )
+        self.assertEqual(len(server.requests), 1)
+
+        for order in self.orders:
+            order.refresh_from_db()
+
+            if order in pending:
+                self.assertIsNone(order.integrator_id)
+                self.assertEqual(order.status, Order.AWAITING_INTEGRATION)
+            else:
+                self.assertIsNotNone(order.integrator_id)
+                self.assertEqual(order.status, Order.IMPORTED)
+
+    def test_falls_back_when_batch_is_not_supported(self):
+        server = self.serve(batch=False)
+
+        pending = self.execute()
+
+        self.assertEqual(pending, self.orders)
+        self.assertEqual(
+            server.requests,
+            [('POST', '/orders/simple/batch', 404)]
+        )
+        self.redis.set.assert_called_once()
+
+
+class SendLabelToIntegratorTestCase(StandInMixin, TestCase):
+    def setUp(self):
+        self.use_media_root()
+        self.server = self.serve()
+
+        self.configuration = Configuration.objects.create(
+            name='label',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        self.orders = []
+
+        for number in range(1, 4):
+            _, created = self.server.create(
+                'integrator',
+                {'order_number': str(number)}
+            )
+            order = Order.objects.create(
+                identifier=number,
+                number=number,
+                configuration=self.configuration,
+                integrator_id=created['id'],
+                status=Order.IMPORTED
+            )
+            order.save_file(
+                'label',
+                f'label/{number}.pdf',
+                ContentFile(f'label {number}'.encode())
+            )
+            self.orders.append(order)
+
+        label = OrderLabel(order=self.orders[0], idseq=1)
+        label.file.save('label/1-1.pdf', ContentFile(b'second volume'))
+
+    def attachments(self, order):
+        attachments = self.server.orders[order.integrator_id]['attachment']
+
+        return [name for name, _ in attachments]
+
+    def test_extra_labels_are_sent_with_the_label(self):
+        SendRequestLabelToIntegrator(self.orders[0]).execute()
+
+        self.assertEqual(
+            self.attachments(self.orders[0]),
+            ['1.pdf', '1-1.pdf']
+        )
+        self.assertTrue(Order.objects.get(id=self.orders[0].id).sent_label)
+
+    def test_rejected_label_is_not_marked_sent(self):
+        order = self.orders[1]
+        order.integrator_id = 9999
+
+        with self.assertRaises(OperationError):
+            SendRequestLabelToIntegrator(order).execute()
+
+        self.assertFalse(Order.objects.get(id=order.id).sent_label)
+
+    def test_batch_leaves_extra_labels_to_single_send(self):
+        pending = SendLabelsBatchToIntegrator(
+            self.configuration,
+            self.orders
+        ).execute()
+
+        self.assertEqual(pending, [self.orders[0]])
+        self.assertEqual(self.attachments(self.orders[0]), [])
+
+        for order in self.orders[1:]:
+            self.assertEqual(self.attachments(order), [f'{order.number}.pdf'])
+            self.assertTrue(Order.objects.get(id=order.id).sent_label)
+
+
+    def test_batch_leaves_rejected_labels_pending(self):
+        rejected = self.orders[1]
+        rejected.integrator_id = 9999
+
+        pending = SendLabelsBatchToIntegrator(
+            self.configuration,
+            self.orders
+        ).execute()
+
+        self.assertEqual(pending, self.orders[:2])
+        self.assertFalse(Order.objects.get(id=rejected.id).sent_label)
+        self.assertTrue(Order.objects.get(id=self.orders[2].id).sent_label)
+
+
+class SendBatchToIntegratorTestCase(StandInMixin, TestCase):
+    def setUp(self):
+        self.use_media_root()
+
+        self.configuration = Configuration.objects.create(
+            name='batch',
+            token='tiny',
+            token_integrator='integrator'
+        )
+
+    def create_orders(self, server):
+        orders = []
+
+        for number in range(1, 7):
+            _, created = server.create(
+                'integrator',
+                {'order_number': str(number)}
+            )
+            order = Order.objects.create(
+                identifier=number,
+                number=number,
+                configuration=self.configuration,
+                integrator_id=created['id'],
+                status=Order.IMPORTED
+            )
+            order.save_file(
+                'xml',
+                f'xml/{number}.xml',
+                ContentFile(f'<nfe>{number}</nfe>'.encode())
+            )
+            order.save_file(
+                'label',
+                f'label/{number}.zpl',
+                ContentFile(f'^XA{number}^XZ'.encode())
+            )
+            orders.append(order)
+
+        # Partes indexadas pelo integrator_id, fora da ordem de criação.
+        orders.reverse()
+
+        return orders
+
+    def files(self, server, order, resource):
+        return [
+            name for name, _ in server.orders[order.integrator_id][resource]
+        ]
+
+    def test_billing_results_are_mapped_by_part(self):
+        server = self.serve(fail_every=3)
+        orders = self.create_orders(server)
+
+        pending = SendBillingBatchToIntegrator(
+            self.configuration,
+            orders
+        ).execute()
+
+        self.assertEqual(pending, [orders[2], orders[5]])
+        self.assertEqual(
+            server.requests,
+            [('POST', '/orders/billing/batch', 207)]
+        )
+
+        for order in orders:
+            expected = [] if order in pending else [f'NFE_{order.number}.xml']
+            self.assertEqual(self.files(server, order, 'billing'), expected)
+
+    def test_labels_results_are_mapped_by_part(self):
+        server = self.serve(fail_every=4)
+        orders = self.create_orders(server)
+
+        pending = SendLabelsBatchToIntegrator(
+            self.configuration,
+            orders
+        ).execute()
+
+        self.assertEqual(pending, [orders[3]])
+
+        for order in orders:
+            order.refresh_from_db()
+            sent = order not in pending
+
+            self.assertEqual(order.sent_label, sent)
+            self.assertEqual(
+                self.files(server, order, 'attachment'),
+                [f'{order.number}.zpl'] if sent else []
+            )
+
+    def test_cancelation(self):
+        server = self.serve()
+        orders = self.create_orders(server)
+
+        pending = SendCancelationBatchToIntegrator(
+            self.configuration,
+            orders
+        ).execute()
+
+        self.assertEqual(pending, [])
+        self.assertEqual(
+            server.requests,
+            [('POST', '/orders/cancelation/batch', 207)]
+        )
+        self.assertTrue(all(
+            server.orders[order.integrator_id]['cancelation']
+            for order in orders
+        ))
+
+    def test_cancelation_falls_back_without_batch(self):
+        server = self.serve(batch=False)
+        orders = self.create_orders(server)
+
+        pending = SendCancelationBatchToIntegrator(
+            self.configuration,
+            orders
+        ).execute()
+
+        self.assertEqual(pending, orders)
+        self.assertFalse(any(
+            server.orders[order.integrator_id]['cancelation']
+            for order in orders
+        ))
+
+
+class DeleteFileTestCase(StandInMixin, TestCase):
+    def setUp(self):
+        self.use_media_root()
+
+        configuration = Configuration.objects.create(
+            name='files',
+            token='tiny',
+            token_integrator='integrator'
+        )
+        self.orders = [
+            Order.objects.create(
+                identifier=number,
+                number=number,
+                configuration=configuration
+            )
+            for number in (1, 2)
+        ]
+
+    def save_label(self, order, content):
+        order.save_file(
+            'label',
+            f'label/{order.number}.zpl',
+            ContentFile(content)
+        )
+
+        return order.label.name
+
+    def age(self, name, seconds):
+        modified = time.time() - seconds
+        os.utime(file_storage.path(name), (modified, modified))
+
+    def test_shared_file_is_kept(self):
+        name = self.save_label(self.orders[0], b'same')
+        self.assertEqual(self.save_label(self.orders[1], b'same'), name)
+
+        with mock.patch('core.models.app') as app:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.save_label(self.orders[0], b'other')
+
+        app.signature.assert_not_called()
+        self.assertTrue(file_storage.exists(name))
+
+    def test_unused_file_is_deleted_after_grace_period(self):
+        name = self.save_label(self.orders[0], b'old')
+
+        with mock.patch('core.models.app') as app:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.save_label(self.orders[0], b'new')
+
+        app.signature.assert_called_once_with(
+            'core.tasks.task_delete_file',
+            args=(name,),
+            countdown=settings.FILE_DELETE_GRACE_SECONDS
+        )
+
+        self.age(name, settings.FILE_DELETE_GRACE_SECONDS + 1)
+        self.assertTrue(delete_unused_file(name))
+        self.assertFalse(file_storage.exists(name))
+
+    def test_reused_file_is_not_deleted(self):
+        name = self.save_label(self.orders[0], b'old')
+        self.save_label(self.orders[0], b'new')
+        self.age(name, settings.FILE_DELETE_GRACE_SECONDS + 1)
+
+        # Outro pedido regrava o mesmo conteúdo, mas ainda não foi salvo.
+        self.assertEqual(file_storage.save('x.zpl', ContentFile(b'old')), name)
+
+        self.assertFalse(delete_unused_file(name))
+        self.assertTrue(file_storage.exists(name))
+
+
+class EntitiesTestCase(SimpleTestCase):
+    # Saída de to_dict antes dos campos serem levantados na criação da
+    # classe; a ordem das chaves faz parte do resultado.
+    ITEM = {
+        'codigo': 'P1',
+        'descricao': 'Produto  ',
+        'unidade': 'UN',
+        'quantidade': '2,000',
+        'valor_unitario': '10.5'
+    }
+    CUSTOMER = {
+        'nome': 'Fulano',
+        'cpf_cnpj': '12345678901',
+        'cep': '12345678',
+        'endereco': 'Rua',
+        'complemento': 'c',
+        'bairro': 'b',
+        'uf': 'sp',
+        'cidade': 'x',
+        'numero': '1'
+    }
+
+    def assertItems(self, entity, expected):
+        self.assertEqual(list(entity.to_dict().items()), expected)
+
+    def test_item(self):
+        self.assertItems(OrderItemData(self.ITEM), [
+            ('product', 'P1'),
+            ('description', 'Produto  '),
+            ('unit_of_measurement', 'UN'),
+            ('quantity', 2.0),
+            ('total_price', 21.0),
+            ('unit_price', 10.5),
+        ])
+
+    def test_many_items_match_single_items(self):
+        values = (
+            ('2,000', '10.50'), ('2,000', 3), (1, '1,005'), ('0', 0),
+            ('2,000', '10.50'),
+        )
+        items = [
+            {'item': dict(self.ITEM, quantidade=quantity,
+                          valor_unitario=price)}
+            for quantity, price in values
+        ]
+
+        self.assertEqual(
+            [item.to_dict() for item in OrderItemData.many(items)],
+            [OrderItemData(item['item']).to_dict() for item in items]
+        )
+
+    def test_customer(self):
+        self.assertItems(CustomerData(self.CUSTOMER), [
+            ('address', 'RUA'),
+            ('city', 'X'),
+            ('cnpj_cpf', '123.456.789-01'),
+            ('complement', 'C'),
+            ('name', 'FULANO'),
+            ('neighbourhood', 'B'),
+            ('number', '1'),
+            ('postal_code', '12345-678'),
+            ('state', 'SP'),
+        ])
+
+    def test_order(self):
+        data = OrderData({
+            'numero': '123',
+            'numero_ecommerce': 'E1',
+            'obs': 'obs - a\n b',
+            'id_nota_fiscal': 9,
+            'cliente': self.CUSTOMER,
+            'itens': [{'item': self.ITEM}]
+        }).to_dict()
+
+        self.assertEqual(
+            list(data),
+            [
+                'invoice_id', 'customer', 'items', 'number', 'number_store',
+                'observation'
+            ]
+        )
+        self.assertEqual(data['invoice_id'], 9)
+        self.assertEqual(
+            data['customer'],
+            CustomerData(self.CUSTOMER).to_dict()
+        )
+        self.assertEqual(
+            [item.to_dict() for item in data['items']],
+            [OrderItemData(self.ITEM).to_dict()]
+        )
+        self.assertEqual(data['number'], 123)
+        self.assertEqual(data['number_store'], 'E1')
+        self.assertEqual(data['observation'], 'obs  a  b')
+
+    def test_invoice(self):
+        data = InvoiceData({
+            'serie': '1',
+            'chave_acesso': 'k',
+            'numero': '5',
+            'situacao': '6',
+            'transportador': {'cpf_cnpj': '12345678000199'},
+            'itens': [{'item': self.ITEM}]
+        }).to_dict()
+
+        self.assertEqual(
+            [(name, value) for name, value in data.items() if name != 'items'],
+            [
+                ('sequence', '1'),
+                ('access_key', 'k'),
+                ('invoice', '5'),
+                ('cnpj_transport', '12.345.678/0001-99'),
+                ('invoice_status', 6),
+            ]
+        )
+        self.assertEqual(
+            [item.to_dict() for item in data['items']],
+            [OrderItemData(self.ITEM).to_dict()]
+        )
+
+    def test_resume_and_expedition(self):
+        self.assertItems(
+            OrderResumeData({'id': 7, 'numero': '8', 'numero_ecommerce': 'x'}),
+            [('identifier', 7), ('number', 8), ('number_store', 'x')]
+        )
+        self.assertItems(
+            OrderExpeditionInfo({'id': 1, 'idAgrupamento': 2}),
+            [('expedition_id', 1), ('group_expedition_id', 2)]
+        )
+
+
+class LegacyFormatattr:
+    """
+    Formatattr antes de utils.normalize, só com o que as entidades usam,
+    como referência para os testes de equivalência.
+    """
+
+    def __init__(self, value):
+        self.value = value
+
+    def test_regex(self, expression):
+        return True if re.match(expression, self.value) else False
+
+    @property
+    def is_zip_code(self):
+        return self.test_regex(r"[0-9]{5}[-][\d]{3}")
+
+    @property
+    def is_cnpj(self):
+        return self.test_regex(
+            r"[0-9]{2}[\.]?[0-9]{3}[\.]?[0-9]{3}[\/]?[0-9]{4}[-]?[0-9]{2}"
+        )
+
+    @property
+    def is_cpf(self):
+        return self.test_regex(
+            r"[0-9]{3}[\.]?[0-9]{3}[\.]?[0-9]{3}[-]?[0-9]{2}"
+        )
+
+    @property
+    def is_empty(self):
+        return self.value is None or len(str(self.value).strip()) <= 0
+
+    @property
+    def remove_blank(self):
+        self.value = str(self.value).strip()
+        self.value = None if self.is_empty else self.value
+
+        return self
+
+    @property
+    def remove_character(self):
+        self.value = str(self.value) \
+            .replace('-', '') \
+            .replace('.', '') \
+            .replace('/', '') \
+            .replace('\r', ' ') \
+            .replace('\n', ' ')
+
+        return self
+
+    @property
+    def in_zip_code(self):
+        if not self.is_zip_code:
+            value = self.remove_character.value
+            self.value = f"{value[:5]}-{value[5:8]}"
+
+        return self
+
+    @property
+    def in_cpf(self):
+        if len(self.remove_character.value) == 11:
+            value = self.value
+            self.value = (
+                f"{value[0:3]}.{value[3:6]}.{value[6:9]}-{value[9:11]}"
+            )
+
+        return self
+
+    @property
+    def in_date(self):
+        if len(self.remove_character.value) == 8:
+            value = self.value
+            self.value = f"{value[:2]}/{value[2:4]}/{value[4:6]}"
+
+        return self
+
+    @property
+    def in_cnpj(self):
+        if not self.is_empty:
+            if self.is_cnpj:
+                value = self.remove_character.value
+                self.value = (
+                    f"{value[:2]}.{value[2:5]}.{value[5:8]}/"
+                    f"{value[8:12]}-{value[12:]}"
+                )
+            else:
+                return self.in_cpf
+
+        return self
+
+    @property
+    def format_float(self):
+        if not self.is_empty:
+            if isinstance(self.value, str):
+                self.value = self.value.replace(',', '.')
+
+            self.value = round(float(self.value), ndigits=2)
+
+        return self
+
+
+class NormalizeTestCase(SimpleTestCase):
+    ALPHABET = '0123456789' * 4 + '-./ ,\r\n\tab'
+
+    # Cadeia de Formatattr usada pelas entidades e a função equivalente.
+    CHAINS = {
+        'cnpj': (lambda f: f.in_cnpj.value, normalize.cnpj),
+        'cpf': (lambda f: f.in_cpf.value, normalize.cpf),
+        'postal_code': (
+            lambda f: f.remove_character.in_zip_code.value,
+            normalize.postal_code
+        ),
+        'zip_code': (lambda f: f.in_zip_code.value, normalize.zip_code),
+        'decimal': (lambda f: f.format_float.value, normalize.decimal),
+        'text': (
+            lambda f: f.remove_character.remove_blank.value,
+            normalize.text
+        ),
+        'remove_character': (
+            lambda f: f.remove_character.value,
+            normalize.remove_character
+        ),
+        'remove_blank': (
+            lambda f: f.remove_blank.value,
+            normalize.remove_blank
+        ),
+        'is_empty': (lambda f: f.is_empty, normalize.is_empty),
+        'is_cnpj': (lambda f: f.is_cnpj, normalize.is_cnpj),
+        'is_cpf': (lambda f: f.is_cpf, normalize.is_cpf),
+        'is_zip_code': (lambda f: f.is_zip_code, normalize.is_zip_code),
+        'date': (lambda f: f.in_date.value, None),
+    }
+
+    def setUp(self):
+        self.random = random.Random(1)
+
+    def value(self):
+        kind = self.random.random()
+
+        if kind < 0.05:
+            return None
+        if kind < 0.1:
+            return self.random.randint(-10 ** 15, 10 ** 15)
+        if kind < 0.15:
+            return self.random.uniform(-1e6, 1e6)
+        if kind < 0.2:
+            return self.random.choice(['', ' ', '  \n', True, False, 0, 0.0])
+
+        return ''.join(
+            self.random.choice(self.ALPHABET)
+            for _ in range(self.random.randint(0, 20))
+        )
+
+    @staticmethod
+    def outcome(function, *args):
+        # Erros também fazem parte do comportamento: basta que o tipo bata.
+        try:
+            return 'ok', function(*args)
+        except Exception as error:
+            return 'error', type(error)
+
+    def test_matches_legacy_formatattr(self):
+        for _ in range(5000):
+            value = self.value()
+
+            for name, (chain, function) in self.CHAINS.items():
+                expected = self.outcome(chain, LegacyFormatattr(value))
+
+                with self.subTest(chain=name, value=value):
+                    self.assertEqual(
+                        self.outcome(chain, Formatattr(value)),
+                        expected
+                    )
+
+                    if function:
+                        self.assertEqual(
+                            self.outcome(function, value),
+                            expected
+                        )
+
+    def test_column_matches_each_value(self):
+        values = [self.value() for _ in range(5000)]
+
+        def decimal(value):
+            return self.outcome(normalize.decimal, value)
+
+        self.assertEqual(
+            normalize.normalize_column(values, decimal),
+            [decimal(value) for value in values]
+        )
@@ -1,6 +1,7 @@
 from django.urls import path
 
-from core.views import receiver_processed_order, receiver_webhooks
+from core.views import (pipeline_stages, receiver_processed_order,
+                        receiver_webhooks, upstream_breakers)
 
 urlpatterns = [
     path('receiver/hooks', receiver_webhooks, name='receiver-hooks'),
@@ -8,5 +9,7 @@ urlpatterns = [
         'receiver/hooks/processed',
         receiver_processed_order,
         name='receiver-hooks-processed'
-    )
+    ),
+    path('status/breakers', upstream_breakers, name='upstream-breakers'),
+    path('status/pipeline', pipeline_stages, name='pipeline-stages')
 ]
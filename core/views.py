@@ -1,9 +1,13 @@
 import json
 
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_GET, require_POST
 
+from core.integration.client import get_redis
+from core.integration.pipeline import pipeline_state
+from core.integration.resilience import breakers_state
 from core.models import Order
 
 
@@ -48,3 +52,19 @@ def receiver_processed_order(request):
         pass
 
     return HttpResponse()
+
+
+@staff_member_required
+@require_GET
+def upstream_breakers(request):
+    return JsonResponse(
+        breakers_state(get_redis())
+    )
+
+
+@staff_member_required
+@require_GET
+def pipeline_stages(request):
+    return JsonResponse(
+        pipeline_state(get_redis())
+    )
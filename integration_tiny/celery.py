@@ -18,6 +18,48 @@ app.autodiscover_tasks()
 
 app.conf.worker_cancel_long_running_tasks_on_connection_loss = True
 
+# Filas por upstream: leituras no Tiny, escritas no integrador e
+# arquivos. Cada fila tem o próprio worker (ver config/supervisord.conf),
+# então um upstream lento não bloqueia os demais. Cada etapa do pipeline
+# de pedidos (core/integration/pipeline.py) é uma task própria roteada
+# para a fila do seu upstream. Tasks não listadas, como os dispatchers do
+# beat, ficam na fila padrão.
+TINY_QUEUE = 'tiny'
+INTEGRATOR_QUEUE = 'integrator'
+FILES_QUEUE = 'files'
+
+app.conf.task_routes = {
+    'core.tasks.task_update_order': {'queue': TINY_QUEUE},
+    'core.tasks.task_update_orders_batch': {'queue': TINY_QUEUE},
+    'core.tasks.task_save_invoice': {'queue': TINY_QUEUE},
+    'core.tasks.task_save_invoice_file': {'queue': TINY_QUEUE},
+    'core.tasks.task_search_expedition': {'queue': TINY_QUEUE},
+    'core.tasks.task_search_expeditions_batch': {'queue': TINY_QUEUE},
+    'core.tasks.task_sync_orders': {'queue': TINY_QUEUE},
+    'core.tasks.task_sync_order_pages': {'queue': TINY_QUEUE},
+    'core.tasks.task_sync_cancelled_orders': {'queue': TINY_QUEUE},
+    'core.tasks.task_get_order_in_integrador': {'queue': INTEGRATOR_QUEUE},
+    'core.tasks.task_send_cancelation_to_integrador': {
+        'queue': INTEGRATOR_QUEUE
+    },
+    'core.tasks.task_send_order_to_integrador': {'queue': INTEGRATOR_QUEUE},
+    'core.tasks.task_send_billing_to_integrador': {
+        'queue': INTEGRATOR_QUEUE
+    },
+    'core.tasks.task_send_batch_to_integrador': {
+        'queue': INTEGRATOR_QUEUE
+    },
+    'core.tasks.task_send_orders_awaiting_integration': {
+        'queue': INTEGRATOR_QUEUE
+    },
+    'core.tasks.task_sync_processed_orders': {'queue': INTEGRATOR_QUEUE},
+    'core.tasks.task_send_labels': {'queue': FILES_QUEUE},
+    'core.tasks.task_save_label': {'queue': FILES_QUEUE},
+    'core.tasks.task_send_label_to_integrador': {'queue': FILES_QUEUE},
+    'core.tasks.task_delete_file': {'queue': FILES_QUEUE},
+}
+app.conf.worker_prefetch_multiplier = 1
+
 
 @app.task(bind=True)
 def debug_task(self):
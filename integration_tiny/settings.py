@@ -131,12 +131,82 @@ MEDIA_ROOT = BASE_DIR / 'media'
 BASE_URL_TINY = config('BASE_URL_TINY')
 BASE_URL_INTEGRATOR = config('BASE_URL_INTEGRATOR')
 
+HTTP_POOL_CONNECTIONS = config('HTTP_POOL_CONNECTIONS', default=10, cast=int)
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=10, cast=int)
+HTTP_CONNECT_TIMEOUT = config('HTTP_CONNECT_TIMEOUT', default=5, cast=float)
+HTTP_READ_TIMEOUT = config('HTTP_READ_TIMEOUT', default=30, cast=float)
+HTTP_RETRY_ATTEMPTS = config('HTTP_RETRY_ATTEMPTS', default=3, cast=int)
+HTTP_RETRY_BACKOFF = config('HTTP_RETRY_BACKOFF', default=0.5, cast=float)
+HTTP_RETRY_MAX_BACKOFF = config(
+    'HTTP_RETRY_MAX_BACKOFF', default=10, cast=float
+)
+
+CIRCUIT_BREAKER_THRESHOLD = config(
+    'CIRCUIT_BREAKER_THRESHOLD', default=5, cast=int
+)
+CIRCUIT_BREAKER_RESET_TIMEOUT = config(
+    'CIRCUIT_BREAKER_RESET_TIMEOUT', default=60, cast=int
+)
+
+TASK_DEADLINE = config('TASK_DEADLINE', default=120, cast=int)
+ORDER_LEASE_SECONDS = config('ORDER_LEASE_SECONDS', default=900, cast=int)
+
+PIPELINE_RETRY_ATTEMPTS = config('PIPELINE_RETRY_ATTEMPTS', default=5, cast=int)
+PIPELINE_RETRY_BACKOFF = config(
+    'PIPELINE_RETRY_BACKOFF', default=30, cast=float
+)
+PIPELINE_RETRY_MAX_BACKOFF = config(
+    'PIPELINE_RETRY_MAX_BACKOFF', default=600, cast=float
+)
+
+TINY_CACHE_SIZE = config('TINY_CACHE_SIZE', default=1024, cast=int)
+TINY_CACHE_TTL = {
+    'pedido.obter.php': config('TINY_CACHE_TTL_ORDER', default=60, cast=int),
+    'nota.fiscal.obter.php': config(
+        'TINY_CACHE_TTL_INVOICE', default=60, cast=int
+    ),
+    'expedicao.obter.php': config(
+        'TINY_CACHE_TTL_EXPEDITION', default=60, cast=int
+    ),
+}
+
+SYNC_ORDERS_CONCURRENCY = config('SYNC_ORDERS_CONCURRENCY', default=4, cast=int)
+SYNC_ORDERS_RETRY_DELAY = config(
+    'SYNC_ORDERS_RETRY_DELAY', default=60, cast=int
+)
+
+DISPATCH_CHUNK_SIZE = config('DISPATCH_CHUNK_SIZE', default=50, cast=int)
+DISPATCH_MAX_CHUNKS = config('DISPATCH_MAX_CHUNKS', default=4, cast=int)
+STREAM_CHUNK_SIZE = config('STREAM_CHUNK_SIZE', default=65536, cast=int)
+FILE_DELETE_GRACE_SECONDS = config(
+    'FILE_DELETE_GRACE_SECONDS', default=600, cast=int
+)
+LABEL_DOWNLOAD_CONCURRENCY = config(
+    'LABEL_DOWNLOAD_CONCURRENCY', default=8, cast=int
+)
+LABEL_MAX_SIZE = config('LABEL_MAX_SIZE', default=20 * 1024 * 1024, cast=int)
+UPDATE_ORDERS_CONCURRENCY = config(
+    'UPDATE_ORDERS_CONCURRENCY', default=10, cast=int
+)
+INTEGRATOR_BATCH_SIZE = config('INTEGRATOR_BATCH_SIZE', default=50, cast=int)
+INTEGRATOR_BATCH_RETRY_AFTER = config(
+    'INTEGRATOR_BATCH_RETRY_AFTER', default=3600, cast=int
+)
+
 CELERY_BROKER_URL = config('CELERY_BROKER_URL')
 CELERY_RESULT_BACKEND = config('CELERY_BROKER_URL')
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 
+RATE_LIMIT_REDIS_URL = config(
+    'RATE_LIMIT_REDIS_URL', default=CELERY_BROKER_URL
+)
+RATE_LIMIT_MAX_WAIT = config('RATE_LIMIT_MAX_WAIT', default=30, cast=int)
+RATE_LIMIT_BLOCK_SECONDS = config(
+    'RATE_LIMIT_BLOCK_SECONDS', default=60, cast=int
+)
+
 CELERY_BEAT_SCHEDULE = {
     'sync-orders': {
         'task': 'core.tasks.task_sync_orders',
@@ -1,5 +1,7 @@
 import re
 
+from utils import normalize
+
 
 class Formatattr(object):
 
@@ -11,33 +13,24 @@ class Formatattr(object):
 
         return True if math_expression else False
 
-    def __format_zip_code(self, value):
-        return f"{value[:5]}-{value[5:8]}"
-
-    def __format_cpf(self, value):
-        return f"{value[0:3]}.{value[3:6]}.{value[6:9]}-{value[9:11]}"
-
-    def __format_cnpj(self, value):
-        return f"{value[:2]}.{value[2:5]}.{value[5:8]}/{value[8:12]}-{value[12:]}"
-
     def __format_date(self, value):
         return f"{value[:2]}/{value[2:4]}/{value[4:6]}"
 
     @property
     def is_zip_code(self):
-        return self.test_regex(r"[0-9]{5}[-][\d]{3}")
+        return normalize.is_zip_code(self.value)
 
     @property
     def is_cnpj(self):
-        return self.test_regex(r"[0-9]{2}[\.]?[0-9]{3}[\.]?[0-9]{3}[\/]?[0-9]{4}[-]?[0-9]{2}")
+        return normalize.is_cnpj(self.value)
 
     @property
     def is_cpf(self):
-        return self.test_regex(r"[0-9]{3}[\.]?[0-9]{3}[\.]?[0-9]{3}[-]?[0-9]{2}")
+        return normalize.is_cpf(self.value)
 
     @property
     def is_empty(self):
-        return self.value is None or len(str(self.value).strip()) <= 0
+        return normalize.is_empty(self.value)
 
     def in_float(self):
         self.value = 0 if self.is_empty else round(float(self.value), 2)
@@ -46,34 +39,25 @@ class Formatattr(object):
 
     @property
     def remove_blank(self):
-        self.value = str(self.value).strip()
-
-        self.value = None if self.is_empty else self.value
+        self.value = normalize.remove_blank(self.value)
 
         return self
 
     @property
     def remove_character(self):
-        self.value = str(self.value) \
-            .replace('-', '') \
-            .replace('.', '') \
-            .replace('/', '') \
-            .replace('\r', ' ') \
-            .replace('\n', ' ')
+        self.value = normalize.remove_character(self.value)
 
         return self
 
     @property
     def in_zip_code(self):
-        if not self.is_zip_code:
-            self.value = self.remove_character.__format_zip_code(self.value)
+        self.value = normalize.zip_code(self.value)
 
         return self
 
     @property
     def in_cpf(self):
-        if len(self.remove_character.value) == 11:
-            self.value = self.remove_character.__format_cpf(self.value)
+        self.value = normalize.cpf(self.value)
 
         return self
 
@@ -92,11 +76,7 @@ class Formatattr(object):
 
     @property
     def in_cnpj(self):
-        if not self.is_empty:
-            if self.is_cnpj:
-                self.value = self.remove_character.__format_cnpj(self.value)
-            else:
-                return self.in_cpf
+        self.value = normalize.cnpj(self.value)
 
         return self
 
@@ -112,12 +92,7 @@ class Formatattr(object):
 
     @property
     def format_float(self):
-        if not self.is_empty:
-            if isinstance(self.value, str):
-                self.value = str(self.value).replace(',', '.')
-                self.value = round(float(self.value), ndigits=2)
-            else:
-                self.value = round(float(self.value), ndigits=2)
+        self.value = normalize.decimal(self.value)
 
         return self
 
@@ -0,0 +1,124 @@
+import re
+from typing import Callable, Iterable, List
+
+ZIP_CODE_PATTERN = re.compile(r"[0-9]{5}[-][\d]{3}")
+CNPJ_PATTERN = re.compile(
+    r"[0-9]{2}[\.]?[0-9]{3}[\.]?[0-9]{3}[\/]?[0-9]{4}[-]?[0-9]{2}"
+)
+CPF_PATTERN = re.compile(r"[0-9]{3}[\.]?[0-9]{3}[\.]?[0-9]{3}[-]?[0-9]{2}")
+
+REMOVE_CHARACTER_TABLE = str.maketrans({
+    '-': None,
+    '.': None,
+    '/': None,
+    '\r': ' ',
+    '\n': ' ',
+})
+
+
+def is_empty(value) -> bool:
+    return value is None or len(str(value).strip()) <= 0
+
+
+def is_zip_code(value) -> bool:
+    return bool(ZIP_CODE_PATTERN.match(value))
+
+
+def is_cnpj(value) -> bool:
+    return bool(CNPJ_PATTERN.match(value))
+
+
+def is_cpf(value) -> bool:
+    return bool(CPF_PATTERN.match(value))
+
+
+def remove_character(value) -> str:
+    return str(value).translate(REMOVE_CHARACTER_TABLE)
+
+
+def remove_blank(value):
+    value = str(value).strip()
+
+    return value or None
+
+
+def zip_code(value):
+    if is_zip_code(value):
+        return value
+
+    value = remove_character(value)
+
+    return f"{value[:5]}-{value[5:8]}"
+
+
+def cpf(value) -> str:
+    value = remove_character(value)
+
+    if len(value) == 11:
+        return f"{value[0:3]}.{value[3:6]}.{value[6:9]}-{value[9:11]}"
+
+    return value
+
+
+def cnpj(value):
+    """
+    CNPJ formatado; valores que não parecem CNPJ são tratados como CPF e
+    valores vazios voltam como vieram.
+    """
+    if is_empty(value):
+        return value
+
+    if not is_cnpj(value):
+        return cpf(value)
+
+    value = remove_character(value)
+
+    return f"{value[:2]}.{value[2:5]}.{value[5:8]}/{value[8:12]}-{value[12:]}"
+
+
+def postal_code(value) -> str:
+    value = remove_character(value)
+
+    return f"{value[:5]}-{value[5:8]}"
+
+
+def text(value):
+    return remove_blank(remove_character(value))
+
+
+def decimal(value):
+    if is_empty(value):
+        return value
+
+    if isinstance(value, str):
+        value = value.replace(',', '.')
+
+    return round(float(value), ndigits=2)
+
+
+def normalize_column(values: Iterable, normalizer: Callable) -> List:
+    """
+    Normaliza uma coluna inteira de valores, como todas as quantidades ou
+    preços de uma nota, calculando cada valor repetido só uma vez.
+    """
+    normalized = {}
+    column = []
+
+    for value in values:
+        # O tipo faz parte da chave para não misturar 1, 1.0 e True.
+        key = (type(value), value)
+
+        try:
+            result = normalized[key]
+        except KeyError:
+            result = normalized[key] = normalizer(value)
+        except TypeError:
+            result = normalizer(value)
+
+        column.append(result)
+
+    return column
+
+
+def decimals(values: Iterable) -> List:
+    return normalize_column(values, decimal)